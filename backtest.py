@@ -0,0 +1,239 @@
+import argparse
+import csv
+import math
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+from feature_store import TeamFormStore
+import profiling
+import predict
+
+# Retrain every N days of the replayed season
+RETRAIN_DAYS = 7
+
+# Seasons run from the fall into the next summer
+SEASON_START = (8, 1)
+
+def season_range(season):
+    # 2023 -> ('2023-08-01', '2024-08-01'), end exclusive
+    month, day = SEASON_START
+    return date(season, month, day).isoformat(), date(season + 1, month, day).isoformat()
+
+def season_of(game_date):
+    year, month, day = (int(part) for part in game_date[:10].split('-'))
+    return year if (month, day) >= SEASON_START else year - 1
+
+def load_games_history(conn, store):
+    # Every game with the columns the store needs plus the results, oldest first
+    query = f"""
+    SELECT {', '.join(store.select_columns())}, home_team_abbr, visitor_team_abbr, home_team_win, home_pts, visitor_pts
+    FROM games
+    ORDER BY game_date, game_id
+    """
+    return conn.execute(query).fetchall()
+
+def load_lines(path):
+    # CSV with game_date,home_team,visitor_team,moneyline,spread (home side, as in the slate format)
+    lines = {}
+    with open(path, newline='') as lines_file:
+        for row in csv.DictReader(lines_file):
+            key = (row['game_date'][:10], row['home_team'], row['visitor_team'])
+            lines[key] = (float(row['moneyline']), float(row['spread']))
+    return lines
+
+def implied_probability(moneyline):
+    # American odds -> break-even win probability
+    return -moneyline / (-moneyline + 100) if moneyline < 0 else 100 / (moneyline + 100)
+
+def moneyline_profit(moneyline, won):
+    # Profit of a 1 unit bet at American odds
+    if not won:
+        return -1.0
+    return 100 / -moneyline if moneyline < 0 else moneyline / 100
+
+def fit(X, y_win, y_diff, n_estimators, n_jobs):
+    # Same estimators as train_models; the walk-forward replay is the holdout, so nothing is split off
+    scaler = StandardScaler()
+    X_scaled = pd.DataFrame(scaler.fit_transform(X), columns=X.columns)
+    jobs = predict.model_jobs(n_jobs)
+    win_model = RandomForestClassifier(n_estimators=n_estimators, random_state=predict.HYPERPARAMETERS['random_state'], n_jobs=jobs)
+    diff_model = RandomForestRegressor(n_estimators=n_estimators, random_state=predict.HYPERPARAMETERS['random_state'], n_jobs=jobs)
+    predict.fit_models(win_model, diff_model, X_scaled, y_win, y_diff)
+    return win_model, diff_model, scaler
+
+@profiling.profiled
+def run_backtest(season=None, retrain_days=RETRAIN_DAYS, n_estimators=None, train_window=None,
+                 n_jobs=predict.N_JOBS, lines=None):
+    # Replays a season day by day: predict each day's games from the form known before it, then add them.
+    # Returns one dict per predicted game.
+    n_estimators = n_estimators or predict.HYPERPARAMETERS['n_estimators']
+    store = TeamFormStore(predict.FEATURE_COLUMNS)
+    columns = store.columns()
+    width = len(columns)
+
+    with predict.POOL.connection() as conn:
+        rows = load_games_history(conn, store)
+    if not rows:
+        raise ValueError("The games table is empty.")
+
+    if season is None:
+        season = season_of(rows[-1][1])
+    start, end = season_range(season)
+
+    # Feature block and results as arrays; training uses each game's own box score like train_models does
+    game_dates = np.array([row[1] for row in rows])
+    values = np.array([row[4:4 + width] for row in rows], dtype=float)
+    results = np.array([row[4 + width + 2:] for row in rows], dtype=float)
+    complete = ~np.isnan(values).any(axis=1) & ~np.isnan(results).any(axis=1)
+    store_rows = [row[:4 + width] for row in rows]
+
+    # Form from every game before the season
+    first = int(np.searchsorted(game_dates, start))
+    store.add_rows(store_rows[:first])
+
+    predictions = []
+    models = None
+    next_retrain = None
+    index = first
+    while index < len(rows) and game_dates[index] < end:
+        game_date = game_dates[index]
+        day_end = int(np.searchsorted(game_dates, game_date, side='right'))
+        day = date.fromisoformat(game_date[:10])
+
+        if models is None or day >= next_retrain:
+            train = complete.copy()
+            train[index:] = False
+            train_rows = np.flatnonzero(train)
+            if train_window:
+                train_rows = train_rows[-train_window:]
+            if len(train_rows) == 0:
+                # Nothing to learn from yet; the day still feeds the store
+                store.add_rows(store_rows[index:day_end])
+                index = day_end
+                continue
+            started = time.perf_counter()
+            models = fit(pd.DataFrame(values[train_rows], columns=columns), results[train_rows, 0],
+                         results[train_rows, 1] - results[train_rows, 2], n_estimators, n_jobs)
+            next_retrain = day + timedelta(days=retrain_days)
+            print(f"{game_date[:10]}: retrained on {len(train_rows)} games in {time.perf_counter() - started:.1f}s")
+
+        # Rest days are known before tip-off, so they come from the game row as in a slate
+        day_rows = rows[index:day_end]
+        matrix = store.feature_matrix(
+            (row[2], row[3], row[4 + store.home_rest_index], row[4 + store.visitor_rest_index]) for row in day_rows
+        )
+        ready = ~np.isnan(matrix).any(axis=1) & ~np.isnan(results[index:day_end]).any(axis=1)
+        if ready.any():
+            win_model, diff_model, scaler = models
+            win_probabilities, point_differentials = predict.predict_features(
+                win_model, diff_model, scaler, pd.DataFrame(matrix[ready], columns=columns))
+            for row, result, win_probability, point_differential in zip(
+                    [row for row, ok in zip(day_rows, ready) if ok], results[index:day_end][ready],
+                    win_probabilities, point_differentials):
+                predictions.append(score_game(row, width, result, win_probability, point_differential, lines))
+        profiling.add_rows(int(ready.sum()))
+
+        store.add_rows(store_rows[index:day_end])
+        index = day_end
+
+    return predictions
+
+def score_game(row, width, result, win_probability, point_differential, lines):
+    home_team_abbr, visitor_team_abbr = row[4 + width:4 + width + 2]
+    home_team_win, home_pts, visitor_pts = result
+    prediction = {
+        'game_id': row[0],
+        'game_date': row[1][:10],
+        'home_team': home_team_abbr,
+        'visitor_team': visitor_team_abbr,
+        'probability': float(win_probability),
+        'point_diff': float(point_differential),
+        'home_team_win': int(home_team_win),
+        'actual_diff': home_pts - visitor_pts,
+    }
+
+    line = lines.get((prediction['game_date'], home_team_abbr, visitor_team_abbr)) if lines else None
+    if line is not None:
+        moneyline, spread = line
+        prediction['moneyline'] = moneyline
+        prediction['spread'] = spread
+        # Back the home side when the model rates it above the price, and cover picks against the spread
+        if prediction['probability'] > implied_probability(moneyline):
+            prediction['moneyline_profit'] = moneyline_profit(moneyline, home_team_win == 1)
+        margin = prediction['actual_diff'] + spread
+        if margin != 0:
+            pick_home = point_differential + spread > 0
+            prediction['ats_win'] = int(pick_home == (margin > 0))
+    return prediction
+
+def summarize(predictions):
+    if not predictions:
+        return {'games': 0}
+
+    probabilities = np.array([p['probability'] for p in predictions])
+    wins = np.array([p['home_team_win'] for p in predictions])
+    diffs = np.array([p['point_diff'] for p in predictions])
+    actual = np.array([p['actual_diff'] for p in predictions])
+    clipped = np.clip(probabilities, 1e-6, 1 - 1e-6)
+
+    summary = {
+        'games': len(predictions),
+        'accuracy': float(((probabilities > 0.5) == (wins == 1)).mean()),
+        'brier': float(((probabilities - wins) ** 2).mean()),
+        'log_loss': float(-(wins * np.log(clipped) + (1 - wins) * np.log(1 - clipped)).mean()),
+        'point_diff_mae': float(np.abs(diffs - actual).mean()),
+    }
+
+    with_lines = [p for p in predictions if 'moneyline' in p]
+    if with_lines:
+        bets = [p['moneyline_profit'] for p in with_lines if 'moneyline_profit' in p]
+        ats = [p['ats_win'] for p in with_lines if 'ats_win' in p]
+        summary['games_with_lines'] = len(with_lines)
+        summary['moneyline_bets'] = len(bets)
+        summary['moneyline_roi'] = sum(bets) / len(bets) if bets else math.nan
+        summary['ats_picks'] = len(ats)
+        summary['ats_accuracy'] = sum(ats) / len(ats) if ats else math.nan
+    return summary
+
+def write_predictions(path, predictions):
+    fields = ['game_id', 'game_date', 'home_team', 'visitor_team', 'probability', 'point_diff', 'home_team_win',
+              'actual_diff', 'moneyline', 'spread', 'moneyline_profit', 'ats_win']
+    with open(path, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(predictions)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a season day by day, retraining on a cadence, and score the predictions.")
+    parser.add_argument('--season', type=int, help="season to replay by starting year, e.g. 2023 for 2023-24 (default: latest)")
+    parser.add_argument('--retrain-days', type=int, default=RETRAIN_DAYS, help="retrain the models every N days")
+    parser.add_argument('--n-estimators', type=int, help="trees per forest (default: the production setting)")
+    parser.add_argument('--train-window', type=int, help="train on only the most recent N games")
+    parser.add_argument('--lines', help="CSV of game_date,home_team,visitor_team,moneyline,spread to score bets against")
+    parser.add_argument('--output', help="write every prediction to this CSV")
+    parser.add_argument('--profile', metavar='REPORT', help="write a JSON timing report to REPORT")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiling.enable()
+
+    started = time.perf_counter()
+    predictions = run_backtest(args.season, args.retrain_days, args.n_estimators, args.train_window,
+                               lines=load_lines(args.lines) if args.lines else None)
+    print(f"\nBacktest finished in {time.perf_counter() - started:.1f}s")
+    for name, value in summarize(predictions).items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+    if args.output:
+        write_predictions(args.output, predictions)
+        print(f"predictions written to {args.output}")
+    if args.profile:
+        profiling.write_report(args.profile)
+
+if __name__ == "__main__":
+    main()
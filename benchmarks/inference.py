@@ -0,0 +1,122 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fetch
+
+def latency(function, calls):
+    # Median seconds per call
+    times = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+def run(args, workdir):
+    teams = synthetic.make_teams(args.teams)
+    synthetic.SyntheticLeagueGameFinder.frames = synthetic.make_team_games(teams, args.seasons, args.games_per_team, seed=args.seed)
+    fetch.REQUESTS_PER_SECOND = float('inf')
+
+    os.chdir(workdir)
+    synthetic.create_database('nba.sqlite', teams)
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_games = importlib.import_module('get_games')
+        predict = importlib.import_module('predict')
+        from feature_store import TeamFormStore
+        from forest import CompiledModels
+
+        get_games.load_games(fetcher=fetch.LeagueGameFinderFetcher(synthetic.SyntheticLeagueGameFinder))
+        win_model, diff_model, scaler, feature_columns = predict.train_models()
+
+    started = time.perf_counter()
+    engine = CompiledModels(win_model, diff_model, scaler, feature_columns)
+    compile_seconds = time.perf_counter() - started
+
+    # Realistic rows: every pairing of teams with the current form
+    store = TeamFormStore(feature_columns)
+    with predict.POOL.connection() as conn:
+        store.load(conn)
+    team_ids = sorted(store.home)
+    pairs = [(home, visitor, 1, 2) for home in team_ids for visitor in team_ids if home != visitor]
+    matrix = store.feature_matrix(pairs)
+    matrix = matrix[~np.isnan(matrix).any(axis=1)]
+    columns = store.columns()
+
+    # Agreement with the sklearn path over every row
+    sklearn_win, sklearn_diff = predict.predict_features(win_model, diff_model, scaler, pd.DataFrame(matrix, columns=columns))
+    compact_win, compact_diff = engine.predict(matrix)
+
+    results = {
+        'config': {'seasons': args.seasons, 'teams': args.teams, 'games_per_team': args.games_per_team,
+                   'trees': win_model.n_estimators, 'max_depth': engine.depth, 'nodes': len(engine.feature)},
+        'compile_seconds': compile_seconds,
+        'max_abs_diff': {
+            'probability': float(np.abs(sklearn_win - compact_win).max()),
+            'point_diff': float(np.abs(sklearn_diff - compact_diff).max()),
+        },
+        'latency': {},
+    }
+
+    for batch in (1, args.slate_games, len(matrix)):
+        rows = matrix[:batch]
+        frame = pd.DataFrame(rows, columns=columns)
+        calls = args.calls if batch <= args.slate_games else max(3, args.calls // 20)
+        sklearn_seconds = latency(lambda: predict.predict_features(win_model, diff_model, scaler, frame), calls)
+        compact_seconds = latency(lambda: engine.predict(rows), calls)
+        results['latency'][str(len(rows))] = {
+            'sklearn_ms': sklearn_seconds * 1000,
+            'compact_ms': compact_seconds * 1000,
+            'sklearn_ms_per_game': sklearn_seconds * 1000 / len(rows),
+            'compact_ms_per_game': compact_seconds * 1000 / len(rows),
+            'speedup': sklearn_seconds / compact_seconds,
+        }
+        print(f"{len(rows):>5} games: sklearn {sklearn_seconds * 1000:8.2f} ms, compact {compact_seconds * 1000:8.2f} ms "
+              f"({sklearn_seconds / compact_seconds:.1f}x)")
+
+    print(f"max |difference|: probability {results['max_abs_diff']['probability']:.2e}, "
+          f"point diff {results['max_abs_diff']['point_diff']:.2e}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-game latency of the compiled forests with scikit-learn.")
+    parser.add_argument('--seasons', type=int, default=5)
+    parser.add_argument('--teams', type=int, default=30)
+    parser.add_argument('--games-per-team', type=int, default=82)
+    parser.add_argument('--slate-games', type=int, default=15)
+    parser.add_argument('--calls', type=int, default=200, help="timed calls per batch size; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix='pre-dict-inference-')
+    cwd = os.getcwd()
+    try:
+        results = run(args, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import synthetic
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fetch
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def copy_database(source, target):
+    # A stale -wal file next to the target would be replayed into the fresh copy
+    shutil.copyfile(source, target)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+
+def measure(name, setup, run, repeat, results):
+    # Timed runs first, then one run under tracemalloc for the peak (tracing slows the code down)
+    runs = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            args = setup()
+            started = time.perf_counter()
+            run(*args)
+            runs.append(time.perf_counter() - started)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        args = setup()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    results[name] = {'seconds': min(runs), 'runs': runs, 'peak_mb': peak / 2 ** 20}
+    print(f"{name:<30} {min(runs):9.3f}s {peak / 2 ** 20:9.1f} MB")
+
+def run_benchmarks(args, workdir):
+    teams = synthetic.make_teams(args.teams)
+    frames = synthetic.make_team_games(teams, args.seasons, args.games_per_team, seed=args.seed)
+
+    # Serve the generated logs through the real fetch path instead of stats.nba.com
+    synthetic.SyntheticLeagueGameFinder.frames = frames
+    fetcher = fetch.LeagueGameFinderFetcher(synthetic.SyntheticLeagueGameFinder)
+    # No rate limit for the generated endpoint; load_games picks the default up when get_games is imported
+    fetch.REQUESTS_PER_SECOND = float('inf')
+
+    base = os.path.join(workdir, 'base.sqlite')
+    loaded = os.path.join(workdir, 'loaded.sqlite')
+    work = os.path.join(workdir, 'work.sqlite')
+    db_name = os.path.join(workdir, 'nba.sqlite')
+    slate = os.path.join(workdir, 'slate.txt')
+    synthetic.create_database(base, teams)
+    synthetic.write_slate(slate, teams, args.slate_games, seed=args.seed)
+
+    # The scripts use nba.sqlite, models/ and cache/ relative to the working directory
+    os.chdir(workdir)
+    copy_database(base, db_name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_games = importlib.import_module('get_games')
+        predict = importlib.import_module('predict')
+
+    results = {}
+
+    def fresh_database():
+        copy_database(base, db_name)
+        return ()
+
+    measure('load_games', fresh_database, lambda: get_games.load_games(fetcher=fetcher), args.repeat, results)
+    copy_database(db_name, loaded)
+
+    def loaded_database():
+        copy_database(loaded, db_name)
+        return ()
+
+    measure('load_games (no new games)', loaded_database, lambda: get_games.load_games(fetcher=fetcher), args.repeat, results)
+
+    def open_work(clear_games):
+        copy_database(loaded, work)
+        conn = sqlite3.connect(work)
+        cursor = conn.cursor()
+        get_games.set_ingest_pragmas(cursor)
+        if clear_games:
+            cursor.execute('DELETE FROM games')
+            conn.commit()
+        return conn, cursor
+
+    def committed(step):
+        def run(conn, cursor):
+            step(conn, cursor)
+            conn.commit()
+            conn.close()
+        return run
+
+    measure('combine_games', lambda: open_work(True), committed(get_games.combine_games), args.repeat, results)
+    measure('stats update (sql)', lambda: open_work(False),
+            committed(get_games.execute_comprehensive_stats_update), args.repeat, results)
+    measure('stats update (vectorized)', lambda: open_work(False),
+            committed(get_games.execute_vectorized_stats_update), args.repeat, results)
+
+    def loaded_pool():
+        loaded_database()
+        predict.POOL.clear()
+        return ()
+
+    def export():
+        with predict.POOL.connection() as conn:
+            predict.training_cache.export_training_data(conn, predict.FEATURE_COLUMNS, predict.DB_NAME)
+
+    measure('export_training_data', loaded_pool, export, args.repeat, results)
+
+    def with_export():
+        loaded_pool()
+        export()
+        return ()
+
+    models = []
+    measure('train_models', with_export, lambda: models.append(predict.train_models()), args.repeat, results)
+    win_model, diff_model, scaler, feature_columns = models[-1]
+
+    def cold_pool():
+        # Drops the cached team ids and form means as well
+        predict.POOL.clear()
+        return ()
+
+    def process_slate():
+        predict.process_input_file(slate, win_model, diff_model, scaler, feature_columns)
+
+    measure('process_input_file', cold_pool, process_slate, args.repeat, results)
+    measure('process_input_file (cached)', lambda: (), process_slate, args.repeat, results)
+
+    with sqlite3.connect(db_name) as conn:
+        games = conn.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+    conn.close()
+    sizes = {
+        'team_rows': sum(len(team_games) for team_games in frames.values()),
+        'games': games,
+        'training_rows': len(np.load(predict.training_cache.cache_paths(db_name)['X'], mmap_mode='r')),
+    }
+    return sizes, results
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\ncompared with {baseline_path} ({baseline.get('commit')})")
+    for name, stage in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        print(f"{name:<30} {before['seconds']:9.3f}s -> {stage['seconds']:9.3f}s "
+              f"({stage['seconds'] / before['seconds']:.2f}x), "
+              f"{before['peak_mb']:.1f} -> {stage['peak_mb']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the ingest, training and prediction stages on generated data.")
+    parser.add_argument('--seasons', type=int, default=5)
+    parser.add_argument('--teams', type=int, default=30)
+    parser.add_argument('--games-per-team', type=int, default=82, help="games per team per season")
+    parser.add_argument('--slate-games', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage; the fastest is reported")
+    parser.add_argument('--output', default='benchmark.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="earlier results file to print a comparison against")
+    parser.add_argument('--workdir', help="directory for the generated database (a temporary one by default)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='pre-dict-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    try:
+        sizes, stages = run_benchmarks(args, workdir)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'seasons': args.seasons,
+            'teams': args.teams,
+            'games_per_team': args.games_per_team,
+            'slate_games': args.slate_games,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'sizes': sizes,
+        'stages': stages,
+    }
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results written to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pandas as pd
+
+FIRST_TEAM_ID = 1610612700
+
+# Same columns LeagueGameFinder returns
+COLUMNS = [
+    'SEASON_ID', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_ID', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN',
+    'PTS', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+    'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PLUS_MINUS'
+]
+
+def make_teams(num_teams):
+    return [(FIRST_TEAM_ID + i, f"T{i:02d}") for i in range(num_teams)]
+
+def box_score(rng):
+    fga = rng.randint(75, 95)
+    fgm = rng.randint(30, 50)
+    fg3a = rng.randint(20, 45)
+    fg3m = rng.randint(5, 18)
+    fta = rng.randint(10, 30)
+    ftm = rng.randint(5, fta)
+    oreb = rng.randint(5, 15)
+    dreb = rng.randint(25, 40)
+    return {
+        'PTS': 2 * (fgm - fg3m) + 3 * fg3m + ftm,
+        'FGM': fgm, 'FGA': fga, 'FG_PCT': round(fgm / fga, 3),
+        'FG3M': fg3m, 'FG3A': fg3a, 'FG3_PCT': round(fg3m / fg3a, 3),
+        'FTM': ftm, 'FTA': fta, 'FT_PCT': round(ftm / fta, 3),
+        'OREB': oreb, 'DREB': dreb, 'REB': oreb + dreb,
+        'AST': rng.randint(15, 30), 'STL': rng.randint(3, 12), 'BLK': rng.randint(2, 9),
+        'TOV': rng.randint(8, 20), 'PF': rng.randint(15, 25),
+    }
+
+def make_team_games(teams, seasons, games_per_team, seed=0, first_season=2000):
+    # {team_id: DataFrame} shaped like LeagueGameFinder(team_id_nullable=team_id), newest game first
+    rng = random.Random(seed)
+    rows = {team_id: [] for team_id, _ in teams}
+    game_number = 0
+
+    for season in range(seasons):
+        season_start = date(first_season + season, 10, 20)
+        for round_number in range(games_per_team):
+            game_date = season_start + timedelta(days=2 * round_number + rng.randint(0, 1))
+            order = rng.sample(teams, len(teams))
+            for home, visitor in zip(order[0::2], order[1::2]):
+                game_number += 1
+                home_box, visitor_box = box_score(rng), box_score(rng)
+                for (team_id, abbr), (_, opponent), box, other, is_home in (
+                        (home, visitor, home_box, visitor_box, True), (visitor, home, visitor_box, home_box, False)):
+                    rows[team_id].append({
+                        'SEASON_ID': f"2{first_season + season}",
+                        'TEAM_ID': team_id,
+                        'TEAM_ABBREVIATION': abbr,
+                        'TEAM_NAME': abbr,
+                        'GAME_ID': f"{game_number:010d}",
+                        'GAME_DATE': game_date.isoformat(),
+                        'MATCHUP': f"{abbr} vs. {opponent}" if is_home else f"{abbr} @ {opponent}",
+                        'WL': 'W' if box['PTS'] > other['PTS'] else 'L',
+                        'MIN': 240,
+                        'PLUS_MINUS': box['PTS'] - other['PTS'],
+                        **box,
+                    })
+
+    return {
+        team_id: pd.DataFrame(team_rows, columns=COLUMNS).sort_values('GAME_DATE', ascending=False).reset_index(drop=True)
+        for team_id, team_rows in rows.items()
+    }
+
+class SyntheticLeagueGameFinder:
+    # Stand-in for nba_api's LeagueGameFinder endpoint serving generated game logs
+    frames = {}
+
+    def __init__(self, team_id_nullable=None, date_from_nullable=None, **kwargs):
+        games = self.frames[team_id_nullable]
+        if date_from_nullable:
+            month, day, year = date_from_nullable.split('/')
+            games = games[games['GAME_DATE'] >= f"{year}-{month}-{day}"]
+        self.games = games.reset_index(drop=True)
+
+    def get_data_frames(self):
+        return [self.games]
+
+def create_database(path, teams):
+    # The team table that ships with nba.sqlite; everything else is built by get_games.py
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE team (id INTEGER PRIMARY KEY, full_name TEXT, abbreviation TEXT, nickname TEXT)')
+        conn.executemany('INSERT INTO team VALUES (?, ?, ?, ?)', [(team_id, abbr, abbr, abbr) for team_id, abbr in teams])
+    conn.close()
+
+def write_slate(path, teams, num_games, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as slate:
+        for _ in range(num_games):
+            (_, home), (_, visitor) = rng.sample(teams, 2)
+            slate.write(f"{home},{visitor},{rng.randint(1, 3)},{rng.randint(1, 3)},-150,-3.5\n")
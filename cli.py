@@ -0,0 +1,107 @@
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import profiling
+
+# Everything heavy (pandas, scikit-learn, nba_api) is imported inside the command that needs it,
+# so --help and argument errors return immediately.
+
+DB_NAME = 'nba.sqlite'
+# predict and train ingest first when the last ingest is older than this (or never happened)
+STALE_HOURS = 12
+
+def ingest(full_refresh=False, stats_engine='vectorized'):
+    from get_games import load_games
+    load_games(full_refresh=full_refresh, stats_engine=stats_engine)
+
+def is_stale(max_age_hours):
+    if not os.path.exists(DB_NAME):
+        return True
+    from get_games import last_ingest_time
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        finished_at = last_ingest_time(conn)
+    finally:
+        conn.close()
+    return finished_at is None or (datetime.now() - finished_at).total_seconds() > max_age_hours * 3600
+
+def ingest_if_needed(args):
+    if args.ingest == 'always' or (args.ingest == 'auto' and is_stale(args.stale_hours)):
+        ingest()
+
+def command_ingest(args):
+    ingest(args.full_refresh, args.stats_engine)
+
+def command_train(args):
+    ingest_if_needed(args)
+    import predict
+    predict.load_or_train_models(warm_start=args.warm_start)
+
+def command_predict(args):
+    ingest_if_needed(args)
+    import predict
+    try:
+        win_model, diff_model, scaler, feature_columns = predict.load_or_train_models()
+        engine = None
+        if args.engine == 'compact':
+            from forest import CompiledModels
+            engine = CompiledModels(win_model, diff_model, scaler, feature_columns)
+
+        print("\nProcessing input file...")
+        predict.process_input_file(args.input_file, win_model, diff_model, scaler, feature_columns, engine)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        print("Please check your database and input file to ensure they contain the necessary data.")
+        raise  # Re-raise the exception to see the full traceback
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--profile', metavar='REPORT', help="write a JSON timing report (stages, row counts, SQL) to REPORT")
+    common.add_argument('--profile-memory', action='store_true', help="with --profile, also trace memory allocations")
+    common.add_argument('--profile-cpu', action='store_true', help="with --profile, also include a cProfile summary")
+
+    freshness = argparse.ArgumentParser(add_help=False)
+    freshness.add_argument('--ingest', choices=['auto', 'always', 'never'], default='auto',
+                           help="fetch new games first: always, never, or only when stale (default: auto)")
+    freshness.add_argument('--stale-hours', type=float, default=STALE_HOURS,
+                           help=f"auto ingests when the last ingest is older than this (default: {STALE_HOURS})")
+
+    parser = argparse.ArgumentParser(description="Predict NBA game results and point differentials.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser('ingest', parents=[common], help="fetch new games and update the games table")
+    ingest_parser.add_argument('--full-refresh', action='store_true', help="refetch every team's full history and rebuild")
+    ingest_parser.add_argument('--stats-engine', choices=['vectorized', 'sql'], default='vectorized')
+    ingest_parser.set_defaults(handler=command_ingest)
+
+    train_parser = commands.add_parser('train', parents=[common, freshness], help="train (or load) the models for the current data")
+    train_parser.add_argument('--warm-start', action='store_true', help="extend the last saved forests instead of retraining")
+    train_parser.set_defaults(handler=command_train)
+
+    predict_parser = commands.add_parser('predict', parents=[common, freshness], help="predict every game in a slate file")
+    predict_parser.add_argument('input_file', help="one game per line: home,away,home_rest,away_rest,moneyline,spread")
+    predict_parser.add_argument('--engine', choices=['sklearn', 'compact'], default='sklearn',
+                                help="score with scikit-learn or with the forests compiled into NumPy node tables")
+    predict_parser.set_defaults(handler=command_predict)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'predict' and not os.path.isfile(args.input_file):
+        parser.error(f"input file not found: {args.input_file}")
+
+    if args.profile:
+        profiling.enable(memory=args.profile_memory, cpu=args.profile_cpu)
+    try:
+        args.handler(args)
+    finally:
+        if args.profile:
+            profiling.write_report(args.profile)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
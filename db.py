@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+import profiling
+from get_games import last_change
+
+POOL_SIZE = 8
+# Per-connection cache of compiled statements; parameterized queries are reused across calls
+CACHED_STATEMENTS = 256
+
+class ReadPool:
+    # Reusable read-only connections to the games database, safe to share between threads.
+    # A connection is only ever used by one caller at a time.
+    def __init__(self, db_name, size=POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self.idle = queue.LifoQueue()
+        # (data version, abbreviation -> team id)
+        self.team_id_map = None
+        self.team_id_lock = threading.Lock()
+        self.team_id_hits = 0
+        self.team_id_misses = 0
+
+        # Dedicated connection for PRAGMA data_version, whose value is only comparable on the same connection
+        self.version_conn = None
+        self.version_lock = threading.Lock()
+        self.epoch = 0
+        # Last PRAGMA data_version seen and the ingest run (last_change) it was read with
+        self.commit_version = None
+        self.change = None
+
+    def connect(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.db_name))}?mode=ro"
+        return profiling.connect(uri, uri=True, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            yield conn
+        finally:
+            if self.idle.qsize() < self.size:
+                self.idle.put(conn)
+            else:
+                conn.close()
+
+    def query(self, query, params=()):
+        with self.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def data_version(self):
+        # Changes whenever load_games (in this process or another) commits new rows, and on clear().
+        # PRAGMA data_version moves on every commit, including the run an ingest without new games records,
+        # so it only decides when to look up the newest ingest run that wrote rows.
+        with self.version_lock:
+            if self.version_conn is None:
+                self.version_conn = self.connect()
+                self.commit_version = None
+            commit_version = self.version_conn.execute('PRAGMA data_version').fetchone()[0]
+            if commit_version != self.commit_version:
+                self.commit_version = commit_version
+                # Without ingest runs to go by (a database that predates them), every commit counts
+                self.change = last_change(self.version_conn) or ('commit', commit_version)
+            return self.epoch, self.change
+
+    def team_ids(self):
+        # Abbreviation -> team id for every home team, reloaded only when the data changed
+        version = self.data_version()
+        cached = self.team_id_map
+        if cached is not None and cached[0] == version:
+            self.team_id_hits += 1
+            return cached[1]
+
+        with self.team_id_lock:
+            if self.team_id_map is None or self.team_id_map[0] != version:
+                self.team_id_misses += 1
+                team_id_map = {}
+                for team_abbr, team_id in self.query('SELECT DISTINCT home_team_abbr, home_team_id FROM games'):
+                    team_id_map.setdefault(team_abbr, team_id)
+                self.team_id_map = (version, team_id_map)
+            return self.team_id_map[1]
+
+    def clear(self):
+        # Forget cached lookups and open connections, e.g. after the database file was replaced
+        self.team_id_map = None
+        with self.version_lock:
+            self.epoch += 1
+            if self.version_conn is not None:
+                self.version_conn.close()
+                self.version_conn = None
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
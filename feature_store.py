@@ -0,0 +1,212 @@
+import numpy as np
+
+from get_games import last_change
+
+# Recent-form windows and head-to-head blend weight of the prediction features
+HOME_WINDOW = 20
+VISITOR_WINDOW = 20
+MATCHUP_WINDOW = 4
+MATCHUP_WEIGHT = 0.2
+
+class RollingWindow:
+    # Last `size` feature rows, newest first, with their column means cached.
+    # Rows are stored column-major so the means are summed in the same order pandas uses.
+    def __init__(self, size, width):
+        self.values = np.full((width, size), np.nan)
+        self.length = 0
+        self.mean = np.full(width, np.nan)
+        # recent_mean results by count, until the next push
+        self.recent_means = {}
+
+    def push(self, row):
+        # Shift everything one slot older, dropping the oldest row once the window is full
+        self.values[:, 1:] = self.values[:, :-1]
+        self.values[:, 0] = row
+        self.length = min(self.length + 1, self.values.shape[1])
+        self.recent_means = {}
+
+        recent = self.values[:, :self.length]
+        missing = np.isnan(recent)
+        sums = np.where(missing, 0, recent).sum(axis=1)
+        counts = (~missing).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = sums / counts
+
+    def recent_mean(self, count):
+        # Mean of the newest `count` rows, summed like `mean`, so it equals the mean a window of that size would hold
+        mean = self.recent_means.get(count)
+        if mean is None:
+            recent = self.values[:, :min(count, self.length)]
+            missing = np.isnan(recent)
+            sums = np.where(missing, 0, recent).sum(axis=1)
+            counts = (~missing).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = self.recent_means[count] = sums / counts
+        return mean
+
+class TeamFormStore:
+    # Rolling per-team home/visitor form and per-pair head-to-head form for the prediction features
+    def __init__(self, feature_columns, home_window=HOME_WINDOW, visitor_window=VISITOR_WINDOW,
+                 matchup_window=MATCHUP_WINDOW, matchup_weight=MATCHUP_WEIGHT):
+        self.feature_columns = list(feature_columns)
+        self.home_columns = [f'home_{col}' for col in self.feature_columns]
+        self.visitor_columns = [f'visitor_{col}' for col in self.feature_columns]
+        self.home_window = home_window
+        self.visitor_window = visitor_window
+        self.matchup_window = matchup_window
+        self.matchup_weight = matchup_weight
+
+        self.clear()
+
+        width = len(self.feature_columns)
+        self.empty = np.full(width, np.nan)
+        self.home_rest_index = self.feature_columns.index('team_rest_days')
+        self.visitor_rest_index = width + self.home_rest_index
+
+    def clear(self):
+        self.home = {}
+        self.visitor = {}
+        self.matchups = {}
+
+        # Newest game_date seen and the game_ids on that date, so updates can resume after it
+        self.last_game_date = None
+        self.last_game_ids = set()
+        # Newest ingest run (last_change) reflected in the windows
+        self.last_run = None
+
+    def select_columns(self):
+        return ['game_id', 'game_date', 'home_team_id', 'visitor_team_id'] + self.home_columns + self.visitor_columns
+
+    def add_game(self, game_id, game_date, home_team_id, visitor_team_id, home_row, visitor_row):
+        # Games must arrive in game_date order
+        home = self.home.get(home_team_id)
+        if home is None:
+            home = self.home[home_team_id] = RollingWindow(self.home_window, len(self.feature_columns))
+        home.push(home_row)
+
+        visitor = self.visitor.get(visitor_team_id)
+        if visitor is None:
+            visitor = self.visitor[visitor_team_id] = RollingWindow(self.visitor_window, len(self.feature_columns))
+        visitor.push(visitor_row)
+
+        matchup = self.matchups.get((home_team_id, visitor_team_id))
+        if matchup is None:
+            matchup = self.matchups[(home_team_id, visitor_team_id)] = RollingWindow(self.matchup_window, 2 * len(self.feature_columns))
+        matchup.push(np.concatenate([home_row, visitor_row]))
+
+        if game_date != self.last_game_date:
+            self.last_game_date = game_date
+            self.last_game_ids = set()
+        self.last_game_ids.add(game_id)
+
+    def add_rows(self, rows):
+        # rows: (game_id, game_date, home_team_id, visitor_team_id, *home features, *visitor features) in game_date order
+        width = len(self.feature_columns)
+        added = 0
+        for row in rows:
+            game_id, game_date, home_team_id, visitor_team_id = row[:4]
+            if game_date == self.last_game_date and game_id in self.last_game_ids:
+                continue
+            values = np.array(row[4:], dtype=float)
+            self.add_game(game_id, game_date, home_team_id, visitor_team_id, values[:width], values[width:])
+            added += 1
+        return added
+
+    def load(self, conn, team_ids=None):
+        # Only the rows that can still be inside some window are read; older ones would be evicted anyway
+        team_filter = ""
+        params = []
+        if team_ids is not None:
+            team_ids = sorted(set(team_ids))
+            placeholders = ', '.join('?' for _ in team_ids)
+            team_filter = f"WHERE home_team_id IN ({placeholders}) OR visitor_team_id IN ({placeholders})"
+            params = team_ids + team_ids
+
+        query = f"""
+        SELECT {', '.join(self.select_columns())} FROM (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY home_team_id ORDER BY game_date DESC) AS home_rank,
+                ROW_NUMBER() OVER (PARTITION BY visitor_team_id ORDER BY game_date DESC) AS visitor_rank,
+                ROW_NUMBER() OVER (PARTITION BY home_team_id, visitor_team_id ORDER BY game_date DESC) AS matchup_rank
+            FROM games
+            {team_filter}
+        )
+        WHERE home_rank <= ? OR visitor_rank <= ? OR matchup_rank <= ?
+        ORDER BY game_date, game_id
+        """
+        params += [self.home_window, self.visitor_window, self.matchup_window]
+        # Read before the rows: a run committed in between only makes the next update reload
+        self.last_run = last_change(conn)
+        return self.add_rows(conn.execute(query, params))
+
+    def update(self, conn):
+        # Push the games ingested since the last load/update, evicting the oldest rows. Only runs that added games
+        # after the newest one held here can be pushed; a run that rewrote older rows (e.g. one-sided games completed
+        # by a catch-up ingest) cannot be slotted into the windows, so the store is reloaded instead.
+        if self.last_game_date is None or self.last_run is None:
+            self.clear()
+            return self.load(conn)
+
+        run, since = conn.execute(
+            'SELECT MAX(rowid), MIN(since) FROM ingest_runs WHERE rowid > ? AND since IS NOT NULL', (self.last_run,)
+        ).fetchone()
+        if run is None:
+            return 0
+        if since <= self.last_game_date:
+            self.clear()
+            return self.load(conn)
+
+        query = f"""
+        SELECT {', '.join(self.select_columns())} FROM games
+        WHERE game_date >= ?
+        ORDER BY game_date, game_id
+        """
+        added = self.add_rows(conn.execute(query, (since,)))
+        self.last_run = run
+        return added
+
+    def features(self, home_team_id, visitor_team_id, home_rest_days, visitor_rest_days):
+        home = self.home.get(home_team_id)
+        visitor = self.visitor.get(visitor_team_id)
+        matchup = self.matchups.get((home_team_id, visitor_team_id))
+        return self.combine(
+            home.mean if home is not None else self.empty,
+            visitor.mean if visitor is not None else self.empty,
+            matchup.mean if matchup is not None else None,
+            home_rest_days, visitor_rest_days, self.matchup_weight)
+
+    def combine(self, home_stats, visitor_stats, matchup_stats, home_rest_days, visitor_rest_days, matchup_weight):
+        # Blend in the head-to-head form when the teams have met in this arrangement (matchup_stats is not None)
+        if matchup_stats is not None:
+            width = len(self.feature_columns)
+            form_weight = 1 - matchup_weight
+            home_stats = form_weight * home_stats + matchup_weight * matchup_stats[:width]
+            visitor_stats = form_weight * visitor_stats + matchup_weight * matchup_stats[width:]
+
+        features = np.concatenate([home_stats, visitor_stats])
+        features[self.home_rest_index] = home_rest_days
+        features[self.visitor_rest_index] = visitor_rest_days
+        return features
+
+    def scenario_features(self, home_team_id, visitor_team_id, home_rest_days, visitor_rest_days,
+                          home_window, visitor_window, matchup_window, matchup_weight):
+        # features() with other windows (no larger than this store's) and another head-to-head weight
+        home = self.home.get(home_team_id)
+        visitor = self.visitor.get(visitor_team_id)
+        matchup = self.matchups.get((home_team_id, visitor_team_id))
+        return self.combine(
+            home.recent_mean(home_window) if home is not None else self.empty,
+            visitor.recent_mean(visitor_window) if visitor is not None else self.empty,
+            matchup.recent_mean(matchup_window) if matchup is not None and matchup_weight else None,
+            home_rest_days, visitor_rest_days, matchup_weight)
+
+    def feature_matrix(self, games):
+        # games: iterable of (home_team_id, visitor_team_id, home_rest_days, visitor_rest_days)
+        games = list(games)
+        matrix = np.empty((len(games), 2 * len(self.feature_columns)))
+        for i, game in enumerate(games):
+            matrix[i] = self.features(*game)
+        return matrix
+
+    def columns(self):
+        return self.home_columns + self.visitor_columns
@@ -0,0 +1,134 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import profiling
+
+CACHE_DIR = 'cache'
+# Cached responses older than this are fetched again; entries are normally dropped as soon as their rows are committed
+CACHE_MAX_AGE = 6 * 60 * 60
+
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 1.0
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 2.0
+
+# A fetcher is anything with fetch(team_id, date_from=None) -> DataFrame in LeagueGameFinder's layout,
+# where date_from is an ISO 'YYYY-MM-DD' date (inclusive) or None for the full history.
+
+class LeagueGameFinderFetcher:
+    # endpoint defaults to nba_api's LeagueGameFinder; nba_api is slow to import, so only ingest pays for it
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+
+    def fetch(self, team_id, date_from=None):
+        endpoint = self.endpoint
+        if endpoint is None:
+            from nba_api.stats.endpoints import leaguegamefinder
+            endpoint = leaguegamefinder.LeagueGameFinder
+
+        if date_from:
+            date_from = datetime.strptime(date_from[:10], '%Y-%m-%d').strftime('%m/%d/%Y')
+            gamefinder = endpoint(team_id_nullable=team_id, date_from_nullable=date_from)
+        else:
+            gamefinder = endpoint(team_id_nullable=team_id)
+        return gamefinder.get_data_frames()[0]
+
+class RecordedFetcher:
+    # Serves previously recorded DataFrames keyed by team id; used for offline runs and tests
+    def __init__(self, frames):
+        self.frames = frames
+
+    def fetch(self, team_id, date_from=None):
+        games = self.frames[team_id]
+        if date_from:
+            games = games[games['GAME_DATE'] >= date_from[:10]]
+        return games.reset_index(drop=True)
+
+class CachedFetcher:
+    # Keeps raw responses on disk until load_games has committed them, so a rerun after a run that died
+    # part way skips the network for the teams already fetched. A later ingest always fetches again.
+    def __init__(self, fetcher, cache_dir=CACHE_DIR, max_age=CACHE_MAX_AGE):
+        self.fetcher = fetcher
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+
+    def cache_path(self, team_id, date_from):
+        return os.path.join(self.cache_dir, f"{team_id}_{date_from or 'all'}.pkl")
+
+    def fetch(self, team_id, date_from=None):
+        path = self.cache_path(team_id, date_from)
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.max_age:
+            return pd.read_pickle(path)
+
+        games = self.fetcher.fetch(team_id, date_from)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        games.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        return games
+
+    def discard(self, team_id, date_from=None):
+        # Called once the response's rows are in the database; the next fetch for the team goes to the network
+        try:
+            os.remove(self.cache_path(team_id, date_from))
+        except FileNotFoundError:
+            pass
+
+class TokenBucket:
+    # Allows `rate` acquisitions per second on average, with bursts of up to `capacity`
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def fetch_with_retry(fetcher, bucket, team_id, date_from, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            with profiling.span('fetch_team'):
+                return fetcher.fetch(team_id, date_from)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            print(f"Fetch for team {team_id} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def fetch_team_games(fetcher, requests, max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND):
+    # requests: {team_id: date_from}. Returns ({team_id: DataFrame}, {team_id: exception}) so one
+    # failing team does not throw away the others.
+    bucket = TokenBucket(requests_per_second)
+    results = {}
+    failures = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            team_id: executor.submit(fetch_with_retry, fetcher, bucket, team_id, date_from)
+            for team_id, date_from in requests.items()
+        }
+        for team_id, future in futures.items():
+            try:
+                results[team_id] = future.result()
+            except Exception as e:
+                failures[team_id] = e
+    return results, failures
@@ -0,0 +1,86 @@
+import numpy as np
+
+# The trained forests compiled into flat node tables and scored with NumPy, without sklearn's per-call input
+# validation and per-tree dispatch. Scores match predict_features up to floating-point summation order.
+
+class CompiledModels:
+    def __init__(self, win_model, diff_model, scaler, feature_columns):
+        self.columns = [f'home_{col}' for col in feature_columns] + [f'visitor_{col}' for col in feature_columns]
+        if list(getattr(scaler, 'feature_names_in_', self.columns)) != self.columns:
+            raise ValueError("The scaler was fitted on different feature columns.")
+
+        self.mean = scaler.mean_ if scaler.with_mean else 0.0
+        self.scale = scaler.scale_ if scaler.with_std else 1.0
+
+        # Leaf values: probability of a home win for the classifier's trees, the point differential for the regressor's
+        win_class = list(win_model.classes_).index(1)
+        tables = [self.leaf_table(tree.tree_, win_class) for tree in win_model.estimators_]
+        tables += [self.leaf_table(tree.tree_, None) for tree in diff_model.estimators_]
+        self.win_trees = len(win_model.estimators_)
+        self.diff_trees = len(diff_model.estimators_)
+
+        # All trees in one table; child indices are shifted to each tree's offset
+        sizes = [len(table[0]) for table in tables]
+        self.roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        self.feature = np.concatenate([table[0] for table in tables])
+        self.threshold = np.concatenate([table[1] for table in tables])
+        self.left = np.concatenate([table[2] + root for table, root in zip(tables, self.roots)])
+        self.right = np.concatenate([table[3] + root for table, root in zip(tables, self.roots)])
+        self.value = np.concatenate([table[4] for table in tables])
+        self.is_leaf = self.left == np.arange(len(self.left))
+        # Left and right child side by side: node n goes to children[2 * n] or children[2 * n + 1]
+        self.children = np.column_stack([self.left, self.right]).ravel()
+        self.depth = max(tree.tree_.max_depth for tree in win_model.estimators_ + diff_model.estimators_)
+
+    @staticmethod
+    def leaf_table(tree, win_class):
+        nodes = np.arange(tree.node_count, dtype=np.intp)
+        leaf = tree.children_left == -1
+
+        # Leaves point at themselves, which is also how predict() recognizes them
+        feature = np.where(leaf, 0, tree.feature).astype(np.intp)
+        threshold = np.where(leaf, np.inf, tree.threshold)
+        left = np.where(leaf, nodes, tree.children_left).astype(np.intp)
+        right = np.where(leaf, nodes, tree.children_right).astype(np.intp)
+
+        if win_class is None:
+            value = tree.value[:, 0, 0].astype(np.float64)
+        else:
+            # Normalized like DecisionTreeClassifier.predict_proba
+            counts = tree.value[:, 0, :]
+            totals = counts.sum(axis=1)
+            totals[totals == 0.0] = 1.0
+            value = counts[:, win_class] / totals
+        return feature, threshold, left, right, value
+
+    def predict(self, matrix):
+        # matrix: (games, features) in self.columns order, without NaN. Returns win probabilities and point differentials.
+        X = np.asarray(matrix, dtype=np.float64)
+        X = ((X - self.mean) / self.scale).astype(np.float32)  # sklearn's trees compare float32 inputs
+
+        # One (row, tree) pair per entry, all trees of both forests stepped together; pairs drop out at their leaf
+        # Inputs are read from the flattened matrix: row offset + feature index
+        offsets = np.repeat(np.arange(0, X.size, X.shape[1], dtype=np.intp), len(self.roots))
+        values = X.ravel()
+        nodes = np.tile(self.roots, len(X))
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_right = values[offsets[active] + self.feature[current]] > self.threshold[current]
+            current = self.children[2 * current + go_right]
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+        leaves = self.value[nodes].reshape(len(X), len(self.roots))
+
+        # Averaged tree by tree, in the order the forests add them up
+        win_probabilities = np.zeros(len(X))
+        for column in leaves[:, :self.win_trees].T:
+            win_probabilities += column
+        win_probabilities /= self.win_trees
+
+        point_differentials = np.zeros(len(X))
+        for column in leaves[:, self.win_trees:].T:
+            point_differentials += column
+        point_differentials /= self.diff_trees
+
+        return win_probabilities, point_differentials
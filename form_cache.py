@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import profiling
+from feature_store import TeamFormStore, HOME_WINDOW, VISITOR_WINDOW, MATCHUP_WINDOW, MATCHUP_WEIGHT
+
+# Cached window means; a full league is 30 home + 30 visitor + 870 head-to-head entries
+FORM_CACHE_SIZE = 4096
+
+class FormCache:
+    # Bounded LRU of recent-form means keyed by (team_id, role, window, data version), where role is 'home',
+    # 'visitor' or 'matchup' (team_id is then a (home_team_id, visitor_team_id) pair). The data version comes
+    # from the read pool and changes when load_games commits new rows, so entries from before such an ingest are
+    # never served.
+    def __init__(self, pool, feature_columns, size=FORM_CACHE_SIZE, home_window=HOME_WINDOW,
+                 visitor_window=VISITOR_WINDOW, matchup_window=MATCHUP_WINDOW, matchup_weight=MATCHUP_WEIGHT):
+        self.pool = pool
+        self.size = size
+        self.store = TeamFormStore(feature_columns, home_window, visitor_window, matchup_window, matchup_weight)
+        self.windows = {'home': home_window, 'visitor': visitor_window, 'matchup': matchup_window}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'team_id_hits': self.pool.team_id_hits,
+            'team_id_misses': self.pool.team_id_misses,
+        }
+
+    def get(self, key):
+        # Cached mean (None for a head-to-head that never happened), or KeyError
+        with self.lock:
+            mean = self.entries[key]
+            self.entries.move_to_end(key)
+            return mean
+
+    def put(self, key, mean):
+        with self.lock:
+            self.entries[key] = mean
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def load(self, keys):
+        # One windowed query for every team in the missing keys, through a throwaway store
+        team_ids = set()
+        for team_id, role, _, _ in keys:
+            team_ids.update(team_id if role == 'matchup' else (team_id,))
+
+        store = TeamFormStore(self.store.feature_columns, self.windows['home'], self.windows['visitor'],
+                              self.windows['matchup'], self.store.matchup_weight)
+        with profiling.span('load_team_form'), self.pool.connection() as conn:
+            store.load(conn, team_ids)
+
+        means = {}
+        for key in keys:
+            team_id, role, _, _ = key
+            window = getattr(store, 'matchups' if role == 'matchup' else role).get(team_id)
+            if window is not None:
+                means[key] = window.mean
+            else:
+                means[key] = None if role == 'matchup' else self.store.empty
+            self.put(key, means[key])
+        return means
+
+    def columns(self):
+        return self.store.columns()
+
+    def feature_matrix(self, games):
+        # Same as TeamFormStore.feature_matrix; games: (home_team_id, visitor_team_id, home_rest_days, visitor_rest_days)
+        games = list(games)
+        version = self.pool.data_version()
+        if version != self.version:
+            # Everything cached belongs to older data now
+            with self.lock:
+                self.entries.clear()
+                self.version = version
+
+        keys = []
+        for home_team_id, visitor_team_id, _, _ in games:
+            keys.append(((home_team_id, 'home', self.windows['home'], version),
+                         (visitor_team_id, 'visitor', self.windows['visitor'], version),
+                         ((home_team_id, visitor_team_id), 'matchup', self.windows['matchup'], version)))
+
+        means = {}
+        missing = []
+        for key in {key for game_keys in keys for key in game_keys}:
+            try:
+                means[key] = self.get(key)
+                self.hits += 1
+            except KeyError:
+                missing.append(key)
+                self.misses += 1
+        if missing:
+            means.update(self.load(missing))
+
+        matrix = np.empty((len(games), len(self.store.columns())))
+        for i, ((_, _, home_rest_days, visitor_rest_days), (home_key, visitor_key, matchup_key)) in enumerate(zip(games, keys)):
+            matrix[i] = self.store.combine(means[home_key], means[visitor_key], means[matchup_key],
+                                           home_rest_days, visitor_rest_days, self.store.matchup_weight)
+        return matrix
@@ -1,20 +1,117 @@
 import sqlite3
-from nba_api.stats.endpoints import leaguegamefinder
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import profiling
+from fetch import CachedFetcher, LeagueGameFinderFetcher, fetch_team_games, MAX_WORKERS, REQUESTS_PER_SECOND
 
 def clean_abbreviation(abbr):
     return abbr.strip().upper()
 
-def create_team_tables(conn, cursor):
-    # Fetch team data
+TEAM_GAME_COLUMNS = [
+    'GAME_ID', 'GAME_DATE', 'TEAM_ID', 'MATCHUP', 'PTS', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT',
+    'FTM', 'FTA', 'FT_PCT', 'OREB', 'DREB', 'AST', 'STL', 'BLK', 'TOV', 'PF'
+]
+
+def set_ingest_pragmas(cursor):
+    # WAL lets readers (pre-dict.py, the server) keep going during ingest; with WAL, NORMAL sync is still crash-safe
+    cursor.execute('PRAGMA journal_mode = WAL')
+    cursor.execute('PRAGMA synchronous = NORMAL')
+    # 64 MB page cache (negative values are KiB)
+    cursor.execute('PRAGMA cache_size = -65536')
+    cursor.execute('PRAGMA temp_store = MEMORY')
+
+def create_ingest_state_table(conn, cursor):
+    # Per-team high-water mark of the games already ingested
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingest_state (
+        team_id INTEGER PRIMARY KEY,
+        last_game_date TEXT,
+        last_game_id TEXT
+    )
+    ''')
+    # One row per finished ingest, so callers can tell how fresh the data is
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingest_runs (
+        finished_at TEXT,
+        since TEXT
+    )
+    ''')
+    conn.commit()
+
+def record_ingest_run(cursor, since):
+    cursor.execute('INSERT INTO ingest_runs (finished_at, since) VALUES (?, ?)',
+                   (datetime.now().isoformat(timespec='seconds'), since))
+
+def last_ingest_time(conn):
+    # When load_games last finished, or None if it never has (or the database predates ingest_runs)
+    try:
+        finished_at = conn.execute('SELECT MAX(finished_at) FROM ingest_runs').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    return datetime.fromisoformat(finished_at) if finished_at else None
+
+def advance_high_water_marks(cursor, marks):
+    # marks: {team_id: (last_game_date, last_game_id)}. Written in the same transaction as the merged games,
+    # so a run that dies before the merge commits leaves the marks where they were.
+    cursor.executemany('''
+    INSERT OR REPLACE INTO ingest_state (team_id, last_game_date, last_game_id) VALUES (?, ?, ?)
+    ''', [(team_id, last_game_date, last_game_id) for team_id, (last_game_date, last_game_id) in marks.items()])
+
+def last_change(conn):
+    # rowid of the newest ingest run that wrote rows to games, or None (none yet, or the database predates ingest_runs).
+    # Readers keep it to tell whether the games table changed without rescanning it.
+    try:
+        return conn.execute('SELECT MAX(rowid) FROM ingest_runs WHERE since IS NOT NULL').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+def get_high_water_mark(cursor, team_id, table_name):
+    state = cursor.execute('SELECT last_game_date FROM ingest_state WHERE team_id = ?', (team_id,)).fetchone()
+    if state:
+        return state[0]
+
+    # Seed from a team table filled before incremental ingest existed
+    table_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone()
+    if table_exists:
+        return cursor.execute(f'SELECT MAX(game_date) FROM "{table_name}"').fetchone()[0]
+    return None
+
+@profiling.profiled
+def create_team_tables(conn, cursor, fetcher, full_refresh=False,
+                       max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND):
+    # Returns the earliest game_date among the rows added, the new high-water marks (for advance_high_water_marks)
+    # and {team_id: date_from} of the fetches that succeeded
     teams = cursor.execute('SELECT id FROM team').fetchall()
 
+    # Fetch games for every team in parallel, starting at each team's last ingested date when there is one
+    high_water_marks = {
+        team[0]: None if full_refresh else get_high_water_mark(cursor, team[0], f"{team[0]}_games")
+        for team in teams
+    }
+    with profiling.span('fetch'):
+        fetched, failures = fetch_team_games(fetcher, high_water_marks, max_workers, requests_per_second)
+        profiling.add_rows(sum(len(games) for games in fetched.values()))
+    for id, error in failures.items():
+        # The high-water mark is left alone, so the next run picks this team up again
+        print(f"Error: Failed to fetch games for team {id}: {error}")
+
+    # Earliest game_date among the rows added by this run
+    since = None
+    marks = {}
+    inserted_rows = 0
+    insert_seconds = 0.0
+
     # Iterate over each team
     for team in teams:
         id = team[0]
-        # Fetch games for the team
-        gamefinder = leaguegamefinder.LeagueGameFinder(team_id_nullable=id)
-        games = gamefinder.get_data_frames()[0]
-
+        if id not in fetched:
+            continue
+        games = fetched[id]
+        last_game_date = high_water_marks[id]
 
         # Create a table for the team's games
         table_name = f"{id}_games"
@@ -44,23 +141,67 @@ def create_team_tables(conn, cursor):
         )
         ''')
         
-        # Insert game data into the team's table
-        for _, game in games.iterrows():
-            cursor.execute(f'''
-            INSERT OR REPLACE INTO "{table_name}" (
-                game_id, game_date, team_id, matchup, PTS, FGM, FGA, FG_PCT, FG3M, FG3A, FG3_PCT,
-                FTM, FTA, FT_PCT, OREB, DREB, AST, STL, BLK, TOV, PF
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                game['GAME_ID'], game['GAME_DATE'], game['TEAM_ID'], game['MATCHUP'], game['PTS'], game['FGM'], game['FGA'],
-                game['FG_PCT'], game['FG3M'], game['FG3A'], game['FG3_PCT'], game['FTM'], game['FTA'], game['FT_PCT'],
-                game['OREB'], game['DREB'], game['AST'], game['STL'], game['BLK'], game['TOV'], game['PF']
-            ))
-    print("team tables created")
+        # Skip games already stored on the last ingested date (the fetch window includes it). Stored rows after
+        # it come from a run that died before merging them, so they are counted again and merged this time.
+        if last_game_date:
+            known_ids = {row[0] for row in cursor.execute(
+                f'SELECT game_id FROM "{table_name}" WHERE game_date = ?', (last_game_date,)
+            )}
+            games = games[~games['GAME_ID'].isin(known_ids)]
+
+        if games.empty:
+            continue
+
+        # Insert the team's games in one statement; object dtype turns NumPy scalars into values sqlite3 can bind
+        insert_started = time.perf_counter()
+        rows = games[TEAM_GAME_COLUMNS].to_numpy(dtype=object).tolist()
+        cursor.executemany(f'''
+        INSERT OR REPLACE INTO "{table_name}" (
+            game_id, game_date, team_id, matchup, PTS, FGM, FGA, FG_PCT, FG3M, FG3A, FG3_PCT,
+            FTM, FTA, FT_PCT, OREB, DREB, AST, STL, BLK, TOV, PF
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        inserted_rows += len(rows)
+
+        conn.commit()
+        insert_seconds += time.perf_counter() - insert_started
+
+        # The mark only moves once load_games has merged these rows
+        latest = games.loc[games['GAME_DATE'].idxmax()]
+        marks[id] = (latest['GAME_DATE'], latest['GAME_ID'])
+
+        earliest = games['GAME_DATE'].min()
+        if since is None or earliest < since:
+            since = earliest
+
+    profiling.add_rows(inserted_rows)
+    rate = inserted_rows / insert_seconds if insert_seconds else 0
+    print(f"team tables created ({inserted_rows} rows in {insert_seconds:.2f}s, {rate:.0f} rows/sec)")
+    return since, marks, {id: high_water_marks[id] for id in fetched}
+
+SCHEMA_VERSION = 1
+
+@profiling.profiled
+def migrate_schema(conn, cursor):
+    # Returns True when the games table was dropped and has to be rebuilt from the team tables
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    rebuild = False
+
+    if version < 1:
+        # Version 1 keys games by game_id and declares the derived stat columns.
+        # games is derived from the team tables, so rebuilding is cheaper than copying.
+        cursor.execute('DROP TABLE IF EXISTS games')
+        rebuild = True
+
+    # user_version is bumped by load_games once the rebuild has been committed
+    conn.commit()
+    return rebuild
 
+@profiling.profiled
 def create_games_table(conn, cursor):
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS games (
+        game_id TEXT PRIMARY KEY,
         game_date TEXT,
         home_team_id INTEGER,
         home_team_abbr TEXT,
@@ -99,110 +240,153 @@ def create_games_table(conn, cursor):
         home_tov INTEGER,
         visitor_tov INTEGER,
         home_pf INTEGER,
-        visitor_pf INTEGER
+        visitor_pf INTEGER,
+        home_team_rest_days FLOAT,
+        visitor_team_rest_days FLOAT,
+        home_team_win INTEGER,
+        visitor_team_win INTEGER,
+        point_differential INTEGER,
+        home_efg FLOAT,
+        visitor_efg FLOAT,
+        home_ts FLOAT,
+        visitor_ts FLOAT,
+        home_treb INTEGER,
+        visitor_treb INTEGER,
+        home_ast_to_ratio FLOAT,
+        visitor_ast_to_ratio FLOAT,
+        home_possessions FLOAT,
+        visitor_possessions FLOAT,
+        home_ortg FLOAT,
+        home_drtg FLOAT,
+        visitor_ortg FLOAT,
+        visitor_drtg FLOAT,
+        pace FLOAT,
+        home_efg_pct FLOAT,
+        home_tov_pct FLOAT,
+        home_orb_pct FLOAT,
+        home_ft_rate FLOAT,
+        visitor_efg_pct FLOAT,
+        visitor_tov_pct FLOAT,
+        visitor_orb_pct FLOAT,
+        visitor_ft_rate FLOAT
     )
     ''')
+
+    # Lookups in pre-dict.py filter by team and read the most recent games first
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_home_team_date ON games (home_team_id, game_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_visitor_team_date ON games (visitor_team_id, game_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_matchup_date ON games (home_team_id, visitor_team_id, game_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_home_abbr ON games (home_team_abbr, home_team_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_visitor_abbr ON games (visitor_team_abbr, visitor_team_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS games_date ON games (game_date)')
     conn.commit()
 
-def combine_games(conn, cursor):
-    teams = cursor.execute('SELECT * FROM team').fetchall()
+STAT_COLUMNS = [
+    'pts', 'fgm', 'fga', 'fg_pct', 'fg3m', 'fg3a', 'fg3_pct', 'ftm', 'fta', 'ft_pct',
+    'oreb', 'dreb', 'ast', 'stl', 'blk', 'tov', 'pf'
+]
+
+@profiling.profiled
+def stage_team_games(conn, cursor, since=None):
+    # Copy every team's rows into one temp table, splitting the matchup once in SQL
+    teams = cursor.execute('SELECT id FROM team').fetchall()
+
+    cursor.execute('DROP TABLE IF EXISTS temp.team_games_stage')
+    cursor.execute(f'''
+    CREATE TEMP TABLE team_games_stage (
+        game_id TEXT,
+        game_date TEXT,
+        team_id INTEGER,
+        is_home INTEGER,
+        this_team_abbr TEXT,
+        opponent_team_abbr TEXT,
+        {', '.join(STAT_COLUMNS)}
+    )
+    ''')
 
+    date_filter = "" if since is None else "WHERE game_date >= ?"
+    params = () if since is None else (since,)
     for team in teams:
-        team_id = team[0]
-        table_name = f"{team_id}_games"
-        games = cursor.execute(f'SELECT * FROM "{table_name}"').fetchall()
-
-        for game in games:
-            game_id, game_date, team_id, matchup, pts, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct, ftm, fta, ft_pct, oreb, dreb, ast, stl, blk, tov, pf = game
-            
-            # Extract home and visitor team abbreviations from matchup
-            if "@" in matchup:
-                this_team_abbr, opponent_team_abbr = matchup.split(" @ ")
-                is_home = False
-            else:
-                this_team_abbr, opponent_team_abbr = matchup.split(" vs. ")
-                is_home = True
-
-            # Clean abbreviations
-            this_team_abbr = this_team_abbr.strip().upper()
-            opponent_team_abbr = opponent_team_abbr.strip().upper()
-
-            # Check if the game already exists in the database
-            existing_game = cursor.execute('''
-                SELECT * FROM games WHERE game_date = ? AND 
-                ((home_team_abbr = ? AND visitor_team_abbr = ?) OR 
-                (home_team_abbr = ? AND visitor_team_abbr = ?))
-            ''', (game_date, this_team_abbr, opponent_team_abbr, opponent_team_abbr, this_team_abbr)).fetchone()
-
-            if existing_game:
-                if is_home:
-                    cursor.execute('''
-                    UPDATE games SET
-                        home_team_id = ?, home_pts = ?, home_fgm = ?, home_fga = ?, home_fg_pct = ?, 
-                        home_fg3m = ?, home_fg3a = ?, home_fg3_pct = ?, home_ftm = ?, home_fta = ?, 
-                        home_ft_pct = ?, home_oreb = ?, home_dreb = ?, home_ast = ?, home_stl = ?, 
-                        home_blk = ?, home_tov = ?, home_pf = ?
-                    WHERE game_date = ? AND home_team_abbr = ? AND visitor_team_abbr = ?
-                    ''', (
-                        team_id, pts, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct, ftm, fta, ft_pct, 
-                        oreb, dreb, ast, stl, blk, tov, pf,
-                        game_date, this_team_abbr, opponent_team_abbr
-                    ))
-                else:
-                    cursor.execute('''
-                    UPDATE games SET
-                        visitor_team_id = ?, visitor_pts = ?, visitor_fgm = ?, visitor_fga = ?, visitor_fg_pct = ?, 
-                        visitor_fg3m = ?, visitor_fg3a = ?, visitor_fg3_pct = ?, visitor_ftm = ?, visitor_fta = ?, 
-                        visitor_ft_pct = ?, visitor_oreb = ?, visitor_dreb = ?, visitor_ast = ?, visitor_stl = ?, 
-                        visitor_blk = ?, visitor_tov = ?, visitor_pf = ?
-                    WHERE game_date = ? AND home_team_abbr = ? AND visitor_team_abbr = ?
-                    ''', (
-                        team_id, pts, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct, ftm, fta, ft_pct, 
-                        oreb, dreb, ast, stl, blk, tov, pf,
-                        game_date, opponent_team_abbr, this_team_abbr
-                    ))
-            else:
-                if is_home:
-                    cursor.execute('''
-                    INSERT INTO games (
-                        game_date, home_team_abbr, visitor_team_abbr, home_team_id, home_pts, home_fgm, home_fga, home_fg_pct, home_fg3m, 
-                        home_fg3a, home_fg3_pct, home_ftm, home_fta, home_ft_pct, home_oreb, home_dreb, home_ast, home_stl, 
-                        home_blk, home_tov, home_pf
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        game_date, this_team_abbr, opponent_team_abbr, team_id, pts, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct, ftm, fta, ft_pct, 
-                        oreb, dreb, ast, stl, blk, tov, pf
-                    ))
-                else:
-                    cursor.execute('''
-                    INSERT INTO games (
-                        game_date, home_team_abbr, visitor_team_abbr, visitor_team_id, visitor_pts, visitor_fgm, visitor_fga, visitor_fg_pct, visitor_fg3m, 
-                        visitor_fg3a, visitor_fg3_pct, visitor_ftm, visitor_fta, visitor_ft_pct, visitor_oreb, visitor_dreb, visitor_ast, visitor_stl, 
-                        visitor_blk, visitor_tov, visitor_pf
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        game_date, opponent_team_abbr, this_team_abbr, team_id, pts, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct, ftm, fta, ft_pct, 
-                        oreb, dreb, ast, stl, blk, tov, pf
-                    ))
-
-            # Log the result to ensure it worked
-            row_count = cursor.execute('SELECT COUNT(*) FROM games WHERE game_date = ? AND ((home_team_abbr = ? AND visitor_team_abbr = ?) OR (home_team_abbr = ? AND visitor_team_abbr = ?))', 
-                                       (game_date, this_team_abbr, opponent_team_abbr, opponent_team_abbr, this_team_abbr)).fetchone()[0]
-            if row_count == 0:
-                print(f"Error: Failed to add or update game on {game_date} for {this_team_abbr}.")
-    print("games table created")
-
-
-def execute_comprehensive_stats_update(conn, cursor):
+        table_name = f"{team[0]}_games"
+        cursor.execute(f'''
+        INSERT INTO team_games_stage
+        SELECT
+            game_id, game_date, team_id,
+            at_pos = 0,
+            UPPER(TRIM(SUBSTR(matchup, 1, CASE WHEN at_pos > 0 THEN at_pos ELSE vs_pos END - 1))),
+            UPPER(TRIM(CASE WHEN at_pos > 0 THEN SUBSTR(matchup, at_pos + 3) ELSE SUBSTR(matchup, vs_pos + 5) END)),
+            {', '.join(STAT_COLUMNS)}
+        FROM (
+            SELECT *, INSTR(matchup, ' @ ') AS at_pos, INSTR(matchup, ' vs. ') AS vs_pos
+            FROM "{table_name}"
+            {date_filter}
+        )
+        ''', params)
+
+    cursor.execute('CREATE INDEX temp.team_games_stage_game ON team_games_stage (game_id, is_home)')
+
+@profiling.profiled
+def combine_games(conn, cursor, since=None):
+    stage_team_games(conn, cursor, since)
+
+    # One row per game_id, oriented home/visitor from whichever side was staged.
+    # Existing games are replaced wholesale; derived columns are recomputed afterwards.
+    cursor.execute('''
+    CREATE TEMP TABLE team_games_keys AS
+    SELECT
+        game_id,
+        MIN(game_date) AS game_date,
+        MIN(CASE WHEN is_home THEN this_team_abbr ELSE opponent_team_abbr END) AS home_team_abbr,
+        MIN(CASE WHEN is_home THEN opponent_team_abbr ELSE this_team_abbr END) AS visitor_team_abbr
+    FROM team_games_stage
+    GROUP BY game_id
+    ''')
+
+    home_columns = ', '.join(f'home_{col}' for col in STAT_COLUMNS)
+    visitor_columns = ', '.join(f'visitor_{col}' for col in STAT_COLUMNS)
+    home_values = ', '.join(f'h.{col}' for col in STAT_COLUMNS)
+    visitor_values = ', '.join(f'v.{col}' for col in STAT_COLUMNS)
+    cursor.execute(f'''
+    INSERT OR REPLACE INTO games (
+        game_id, game_date, home_team_id, home_team_abbr, visitor_team_id, visitor_team_abbr,
+        {home_columns}, {visitor_columns}
+    )
+    SELECT
+        k.game_id, k.game_date, h.team_id, k.home_team_abbr, v.team_id, k.visitor_team_abbr,
+        {home_values}, {visitor_values}
+    FROM team_games_keys k
+    LEFT JOIN team_games_stage h ON h.game_id = k.game_id AND h.is_home = 1
+    LEFT JOIN team_games_stage v ON v.game_id = k.game_id AND v.is_home = 0
+    ''')
+    inserted = cursor.rowcount
+    profiling.add_rows(inserted)
+
+    one_sided = cursor.execute('''
+    SELECT COUNT(*) FROM team_games_keys k
+    WHERE (SELECT COUNT(*) FROM team_games_stage s WHERE s.game_id = k.game_id) < 2
+    ''').fetchone()[0]
+    if one_sided:
+        print(f"Warning: {one_sided} games only have one team's row.")
+
+    cursor.execute('DROP TABLE temp.team_games_keys')
+    cursor.execute('DROP TABLE temp.team_games_stage')
+    # Not committed here: load_games commits the merge together with the derived stats
+    print(f"games table created ({inserted} games merged)")
+
+
+@profiling.profiled
+def execute_comprehensive_stats_update(conn, cursor, since=None):
+    # Restrict the updates to rows on or after `since` when only new games were merged
+    where_since = "" if since is None else "WHERE game_date >= ?"
+    and_since = "" if since is None else "AND games.game_date >= ?"
+    params = () if since is None else (since,)
 
     sql_commands = [
         # Update rest days
         """
         WITH previous_games AS (
           SELECT 
-            game_date, 
-            home_team_id,
-            visitor_team_id,
+            game_id,
             LAG(game_date) OVER (PARTITION BY home_team_id ORDER BY game_date) as home_prev_game,
             LAG(game_date) OVER (PARTITION BY visitor_team_id ORDER BY game_date) as visitor_prev_game
           FROM games
@@ -218,9 +402,8 @@ def execute_comprehensive_stats_update(conn, cursor):
             ELSE MIN(JULIANDAY(games.game_date) - JULIANDAY(previous_games.visitor_prev_game), 180)
           END
         FROM previous_games
-        WHERE games.game_date = previous_games.game_date
-          AND games.home_team_id = previous_games.home_team_id
-          AND games.visitor_team_id = previous_games.visitor_team_id;
+        WHERE games.game_id = previous_games.game_id
+          {and_since};
         """,
 
         # Update win columns
@@ -228,38 +411,43 @@ def execute_comprehensive_stats_update(conn, cursor):
         UPDATE games
         SET 
           home_team_win = CASE WHEN home_pts > visitor_pts THEN 1 ELSE 0 END,
-          visitor_team_win = CASE WHEN visitor_pts > home_pts THEN 1 ELSE 0 END;
+          visitor_team_win = CASE WHEN visitor_pts > home_pts THEN 1 ELSE 0 END
+        {where_since};
         """,
 
         # 1. Point Differential
-        "UPDATE games SET point_differential = home_pts - visitor_pts;",
+        "UPDATE games SET point_differential = home_pts - visitor_pts {where_since};",
 
         # 2. Effective Field Goal Percentage (eFG%)
         """
         UPDATE games 
         SET home_efg = (home_fgm + 0.5 * home_fg3m) / home_fga,
-            visitor_efg = (visitor_fgm + 0.5 * visitor_fg3m) / visitor_fga;
+            visitor_efg = (visitor_fgm + 0.5 * visitor_fg3m) / visitor_fga
+        {where_since};
         """,
 
         # 3. True Shooting Percentage (TS%)
         """
         UPDATE games 
         SET home_ts = home_pts / (2 * (home_fga + 0.44 * home_fta)),
-            visitor_ts = visitor_pts / (2 * (visitor_fga + 0.44 * visitor_fta));
+            visitor_ts = visitor_pts / (2 * (visitor_fga + 0.44 * visitor_fta))
+        {where_since};
         """,
 
         # 4. Offensive and Defensive Rebounds
         """
         UPDATE games 
         SET home_treb = home_oreb + home_dreb,
-            visitor_treb = visitor_oreb + visitor_dreb;
+            visitor_treb = visitor_oreb + visitor_dreb
+        {where_since};
         """,
 
         # 5. Assist to Turnover Ratio
         """
         UPDATE games 
         SET home_ast_to_ratio = CASE WHEN home_tov > 0 THEN CAST(home_ast AS FLOAT) / home_tov ELSE NULL END,
-            visitor_ast_to_ratio = CASE WHEN visitor_tov > 0 THEN CAST(visitor_ast AS FLOAT) / visitor_tov ELSE NULL END;
+            visitor_ast_to_ratio = CASE WHEN visitor_tov > 0 THEN CAST(visitor_ast AS FLOAT) / visitor_tov ELSE NULL END
+        {where_since};
         """,
 
         # 6. Possessions (estimated)
@@ -268,7 +456,8 @@ def execute_comprehensive_stats_update(conn, cursor):
         SET home_possessions = 0.5 * ((home_fga + 0.4 * home_fta - 1.07 * (home_oreb / (home_oreb + visitor_dreb)) * (home_fga - home_fgm) + home_tov) + 
                                       (visitor_fga + 0.4 * visitor_fta - 1.07 * (visitor_oreb / (visitor_oreb + home_dreb)) * (visitor_fga - visitor_fgm) + visitor_tov)),
             visitor_possessions = 0.5 * ((visitor_fga + 0.4 * visitor_fta - 1.07 * (visitor_oreb / (visitor_oreb + home_dreb)) * (visitor_fga - visitor_fgm) + visitor_tov) + 
-                                         (home_fga + 0.4 * home_fta - 1.07 * (home_oreb / (home_oreb + visitor_dreb)) * (home_fga - home_fgm) + home_tov));
+                                         (home_fga + 0.4 * home_fta - 1.07 * (home_oreb / (home_oreb + visitor_dreb)) * (home_fga - home_fgm) + home_tov))
+        {where_since};
         """,
 
         # 7. Offensive and Defensive Rating
@@ -277,13 +466,15 @@ def execute_comprehensive_stats_update(conn, cursor):
         SET home_ortg = (home_pts / home_possessions) * 100,
             home_drtg = (visitor_pts / visitor_possessions) * 100,
             visitor_ortg = (visitor_pts / visitor_possessions) * 100,
-            visitor_drtg = (home_pts / home_possessions) * 100;
+            visitor_drtg = (home_pts / home_possessions) * 100
+        {where_since};
         """,
 
         # 8. Pace
         """
         UPDATE games 
-        SET pace = 48 * ((home_possessions + visitor_possessions) / (2 * 48));
+        SET pace = 48 * ((home_possessions + visitor_possessions) / (2 * 48))
+        {where_since};
         """,
 
         # 9. Four Factors
@@ -296,33 +487,185 @@ def execute_comprehensive_stats_update(conn, cursor):
             visitor_efg_pct = (CAST(visitor_fgm AS FLOAT) + 0.5 * CAST(visitor_fg3m AS FLOAT)) / NULLIF(CAST(visitor_fga AS FLOAT), 0),
             visitor_tov_pct = CAST(visitor_tov AS FLOAT) / NULLIF((CAST(visitor_fga AS FLOAT) + 0.44 * CAST(visitor_fta AS FLOAT) + CAST(visitor_tov AS FLOAT)), 0),
             visitor_orb_pct = CAST(visitor_oreb AS FLOAT) / NULLIF((CAST(visitor_oreb AS FLOAT) + CAST(home_dreb AS FLOAT)), 0),
-            visitor_ft_rate = CAST(visitor_fta AS FLOAT) / NULLIF(CAST(visitor_fga AS FLOAT), 0);
+            visitor_ft_rate = CAST(visitor_fta AS FLOAT) / NULLIF(CAST(visitor_fga AS FLOAT), 0)
+        {where_since};
         """
     ]
 
     for command in sql_commands:
-        cursor.execute(command)
+        cursor.execute(command.format(where_since=where_since, and_since=and_since), params)
     print("advanced stats updated")
 
-def load_games():
+DERIVED_COLUMNS = [
+    'home_team_rest_days', 'visitor_team_rest_days', 'home_team_win', 'visitor_team_win', 'point_differential',
+    'home_efg', 'visitor_efg', 'home_ts', 'visitor_ts', 'home_treb', 'visitor_treb',
+    'home_ast_to_ratio', 'visitor_ast_to_ratio', 'home_possessions', 'visitor_possessions',
+    'home_ortg', 'home_drtg', 'visitor_ortg', 'visitor_drtg', 'pace',
+    'home_efg_pct', 'home_tov_pct', 'home_orb_pct', 'home_ft_rate',
+    'visitor_efg_pct', 'visitor_tov_pct', 'visitor_orb_pct', 'visitor_ft_rate'
+]
+
+def divide(numerator, denominator):
+    # SQLite returns NULL for division by zero; NaN is written back as NULL
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator == 0, np.nan, numerator / denominator)
+
+def integer_divide(numerator, denominator):
+    # Same as "/" between two INTEGER columns in SQLite (the stats are never negative)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator == 0, np.nan, np.floor_divide(numerator, denominator))
+
+def compute_rest_days(game_dates, team_ids):
+    # Days since the team's previous game in the same role, capped at 180 (LAG over team_id ORDER BY game_date)
+    days = pd.to_datetime(pd.Series(game_dates)).to_numpy().astype('datetime64[s]').astype(np.int64) / 86400
+    order = np.lexsort((days, team_ids))
+    rest_days = np.full(len(days), np.nan)
+    sorted_days = days[order]
+    same_team = team_ids[order][1:] == team_ids[order][:-1]
+    gaps = np.where(same_team, sorted_days[1:] - sorted_days[:-1], np.nan)
+    rest_days[order[1:]] = np.minimum(gaps, 180)
+    return rest_days
+
+def compute_derived_stats(stats):
+    # stats maps each home_/visitor_ base column to a float array; returns the derived columns in the same form
+    derived = {}
+    for side, other in (('home', 'visitor'), ('visitor', 'home')):
+        fgm, fga, fg3m = stats[f'{side}_fgm'], stats[f'{side}_fga'], stats[f'{side}_fg3m']
+        fta, pts, tov = stats[f'{side}_fta'], stats[f'{side}_pts'], stats[f'{side}_tov']
+        oreb, dreb, ast = stats[f'{side}_oreb'], stats[f'{side}_dreb'], stats[f'{side}_ast']
+        other_dreb = stats[f'{other}_dreb']
+
+        derived[f'{side}_efg'] = divide(fgm + 0.5 * fg3m, fga)
+        derived[f'{side}_ts'] = divide(pts, 2 * (fga + 0.44 * fta))
+        derived[f'{side}_treb'] = oreb + dreb
+        derived[f'{side}_ast_to_ratio'] = np.where(tov > 0, divide(ast, tov), np.nan)
+        derived[f'{side}_efg_pct'] = divide(fgm + 0.5 * fg3m, fga)
+        derived[f'{side}_tov_pct'] = divide(tov, fga + 0.44 * fta + tov)
+        derived[f'{side}_orb_pct'] = divide(oreb, oreb + other_dreb)
+        derived[f'{side}_ft_rate'] = divide(fta, fga)
+
+        # One team's possession estimate; the offensive rebound share is an integer division, as in the SQL chain
+        derived[f'{side}_estimate'] = fga + 0.4 * fta - 1.07 * integer_divide(oreb, oreb + other_dreb) * (fga - fgm) + tov
+
+    # Computed once and reused for ratings and pace instead of being re-derived per statement
+    home_estimate, visitor_estimate = derived.pop('home_estimate'), derived.pop('visitor_estimate')
+    home_possessions = 0.5 * (home_estimate + visitor_estimate)
+    visitor_possessions = 0.5 * (visitor_estimate + home_estimate)
+    derived['home_possessions'] = home_possessions
+    derived['visitor_possessions'] = visitor_possessions
+
+    home_pts, visitor_pts = stats['home_pts'], stats['visitor_pts']
+    # Missing points compare as NULL in SQL, which the CASE turns into a loss; NaN > x is False here too
+    derived['home_team_win'] = (home_pts > visitor_pts).astype(float)
+    derived['visitor_team_win'] = (visitor_pts > home_pts).astype(float)
+    derived['point_differential'] = home_pts - visitor_pts
+    derived['home_ortg'] = divide(home_pts, home_possessions) * 100
+    derived['home_drtg'] = divide(visitor_pts, visitor_possessions) * 100
+    derived['visitor_ortg'] = divide(visitor_pts, visitor_possessions) * 100
+    derived['visitor_drtg'] = divide(home_pts, home_possessions) * 100
+    derived['pace'] = 48 * ((home_possessions + visitor_possessions) / (2 * 48))
+    return derived
+
+@profiling.profiled
+def execute_vectorized_stats_update(conn, cursor, since=None):
+    # Single pass alternative to execute_comprehensive_stats_update: compute every derived column with NumPy
+    # and write them back with one UPDATE per row in a single executemany
+    keys = cursor.execute('SELECT game_id, game_date, home_team_id, visitor_team_id FROM games').fetchall()
+    if not keys:
+        print("advanced stats updated (0 rows)")
+        return
+    game_ids, game_dates, home_team_ids, visitor_team_ids = (np.array(column) for column in zip(*keys))
+    home_team_ids = np.array([-1 if team_id is None else team_id for team_id in home_team_ids])
+    visitor_team_ids = np.array([-1 if team_id is None else team_id for team_id in visitor_team_ids])
+
+    # Rest days need every earlier game, the box-score stats only the rows being updated
+    rest_days = {
+        'home_team_rest_days': compute_rest_days(game_dates, home_team_ids),
+        'visitor_team_rest_days': compute_rest_days(game_dates, visitor_team_ids),
+    }
+
+    base_columns = [f'{side}_{col}' for side in ('home', 'visitor') for col in STAT_COLUMNS]
+    if since is None:
+        rows = cursor.execute(f'SELECT game_id, {", ".join(base_columns)} FROM games').fetchall()
+    else:
+        rows = cursor.execute(f'SELECT game_id, {", ".join(base_columns)} FROM games WHERE game_date >= ?', (since,)).fetchall()
+    if not rows:
+        print("advanced stats updated (0 rows)")
+        return
+
+    # Line the stats rows up with the key arrays
+    position = {game_id: i for i, game_id in enumerate(game_ids)}
+    index = np.array([position[row[0]] for row in rows])
+    values = np.array([row[1:] for row in rows], dtype=float)
+    stats = {column: values[:, i] for i, column in enumerate(base_columns)}
+
+    derived = compute_derived_stats(stats)
+    derived['home_team_rest_days'] = rest_days['home_team_rest_days'][index]
+    derived['visitor_team_rest_days'] = rest_days['visitor_team_rest_days'][index]
+
+    updates = list(zip(*(derived[column].tolist() for column in DERIVED_COLUMNS), (row[0] for row in rows)))
+    cursor.executemany(f'''
+    UPDATE games SET {", ".join(f"{column} = ?" for column in DERIVED_COLUMNS)}
+    WHERE game_id = ?
+    ''', updates)
+    profiling.add_rows(len(updates))
+    print(f"advanced stats updated ({len(updates)} rows)")
+
+def discard_fetched(fetcher, fetched_from):
+    # Only a CachedFetcher keeps responses around; they are dropped once the run that used them has committed
+    discard = getattr(fetcher, 'discard', None)
+    if discard is not None:
+        for team_id, date_from in fetched_from.items():
+            discard(team_id, date_from)
+
+@profiling.profiled
+def load_games(full_refresh=False, fetcher=None, stats_engine='vectorized'):
     # Connect to the SQLite database
-    conn = sqlite3.connect('nba.sqlite')
-    cursor = conn.cursor()
-
-    # Create the team tables
-    create_team_tables(conn, cursor)
-
-    # Create the games table
-    create_games_table(conn, cursor)
-
-    # Combine the games
-    combine_games(conn, cursor)
-
-    # Execute the comprehensive stats update
-    execute_comprehensive_stats_update(conn, cursor)
-
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
-
-load_games()
\ No newline at end of file
+    conn = profiling.connect('nba.sqlite')
+    try:
+        cursor = conn.cursor()
+        set_ingest_pragmas(cursor)
+
+        # Bring an older database up to the current schema
+        rebuild = migrate_schema(conn, cursor)
+
+        # Track what has already been ingested per team
+        create_ingest_state_table(conn, cursor)
+
+        # Create or extend the team tables, fetching only games past each team's high-water mark
+        if fetcher is None:
+            fetcher = CachedFetcher(LeagueGameFinderFetcher())
+        since, marks, fetched_from = create_team_tables(conn, cursor, fetcher, full_refresh)
+
+        # Create the games table
+        create_games_table(conn, cursor)
+
+        full_refresh = full_refresh or rebuild
+        if since is None and not full_refresh:
+            print("no new games")
+            record_ingest_run(cursor, since)
+            conn.commit()
+            discard_fetched(fetcher, fetched_from)
+            return
+
+        # Combine the games (only the new ones unless this is a full refresh)
+        combine_games(conn, cursor, None if full_refresh else since)
+
+        # Recompute the derived stats over the affected rows ('sql' runs the original UPDATE chain)
+        if stats_engine == 'sql':
+            execute_comprehensive_stats_update(conn, cursor, None if full_refresh else since)
+        else:
+            execute_vectorized_stats_update(conn, cursor, None if full_refresh else since)
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        if full_refresh:
+            # Every row was rewritten
+            since = cursor.execute('SELECT MIN(game_date) FROM games').fetchone()[0]
+        advance_high_water_marks(cursor, marks)
+        record_ingest_run(cursor, since)
+
+        # Commit the merged games, their derived stats, the high-water marks and the run at once
+        conn.commit()
+        discard_fetched(fetcher, fetched_from)
+    finally:
+        # Without a commit (the run failed part way) this rolls the merge back
+        conn.close()
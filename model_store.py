@@ -0,0 +1,74 @@
+import glob
+import hashlib
+import json
+import os
+
+import joblib
+
+import profiling
+from get_games import last_change
+
+# Bump when the layout of the saved artifact changes
+ARTIFACT_VERSION = 1
+MODEL_DIR = 'models'
+
+def training_fingerprint(conn, feature_columns, hyperparameters):
+    # Cheap summary of the training data; changes whenever games are added or rewritten.
+    # The ingest run catches rewrites that keep the row count and newest date, like completed one-sided games.
+    row_count, max_game_date = conn.execute('SELECT COUNT(*), MAX(game_date) FROM games').fetchone()
+
+    payload = json.dumps({
+        'artifact_version': ARTIFACT_VERSION,
+        'row_count': row_count,
+        'max_game_date': max_game_date,
+        'last_change': last_change(conn),
+        'feature_columns': list(feature_columns),
+        'hyperparameters': hyperparameters,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def artifact_path(fingerprint, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"models-v{ARTIFACT_VERSION}-{fingerprint[:16]}.joblib")
+
+@profiling.profiled
+def load_models(fingerprint, model_dir=MODEL_DIR):
+    path = artifact_path(fingerprint, model_dir)
+    if not os.path.exists(path):
+        return None
+
+    # No mmap_mode: unpickling a tree copies its node and value arrays into sklearn's own buffers anyway
+    artifact = joblib.load(path)
+    if artifact.get('fingerprint') != fingerprint:
+        return None
+    return artifact['win_model'], artifact['diff_model'], artifact['scaler'], artifact['feature_columns']
+
+@profiling.profiled
+def load_latest_models(model_dir=MODEL_DIR):
+    # Most recent artifact of this version whatever data it was trained on, as a warm-start base
+    paths = glob.glob(os.path.join(model_dir, f"models-v{ARTIFACT_VERSION}-*.joblib"))
+    if not paths:
+        return None
+    artifact = joblib.load(max(paths, key=os.path.getmtime))
+    return artifact['win_model'], artifact['diff_model'], artifact['scaler'], artifact['feature_columns']
+
+@profiling.profiled
+def save_models(fingerprint, win_model, diff_model, scaler, feature_columns, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    path = artifact_path(fingerprint, model_dir)
+
+    # Write to a temporary file first so readers never see a partial artifact
+    tmp_path = path + '.tmp'
+    joblib.dump({
+        'fingerprint': fingerprint,
+        'win_model': win_model,
+        'diff_model': diff_model,
+        'scaler': scaler,
+        'feature_columns': list(feature_columns),
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+    # Drop artifacts trained on older data
+    for old_path in glob.glob(os.path.join(model_dir, 'models-v*.joblib')):
+        if old_path != path:
+            os.remove(old_path)
+    return path
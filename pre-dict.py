@@ -1,185 +1,257 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
+import os
 import sys
-from get_games import load_games
+import time
+from concurrent.futures import ThreadPoolExecutor
+import model_store
+from feature_store import TeamFormStore
+from db import ReadPool
+from form_cache import FormCache
+import training_cache
+import profiling
 
 # Update this to match your .sqlite file name
 DB_NAME = 'nba.sqlite'
 
-def get_home_games(team_id, num_games=10):
-    query = f"""
-    SELECT * FROM games
-    WHERE home_team_id = {team_id}
-    ORDER BY game_date DESC
-    LIMIT {num_games}
-    """
-    with sqlite3.connect(DB_NAME) as conn:
-        return pd.read_sql_query(query, conn)
-    
-def get_visitor_games(team_id, num_games=10):
-    query = f"""
-    SELECT * FROM games
-    WHERE visitor_team_id = {team_id}
-    ORDER BY game_date DESC
-    LIMIT {num_games}
-    """
-    with sqlite3.connect(DB_NAME) as conn:
-        return pd.read_sql_query(query, conn)
-
-def get_matchup_stats(home_team_id, visitor_team_id, num_games=10):
-    query = f"""
-    SELECT * FROM games
-    WHERE home_team_id = {home_team_id} AND visitor_team_id = {visitor_team_id}
-    ORDER BY game_date DESC
-    LIMIT {num_games}
-    """
-    with sqlite3.connect(DB_NAME) as conn:
-        return pd.read_sql_query(query, conn)
-
-def clean_data(df):
-    # Remove rows with NaN values
-    df_cleaned = df.dropna()
-    
-    return df_cleaned
-
-def train_models():
-    query = "SELECT * FROM games"
-    
-    with sqlite3.connect(DB_NAME) as conn:
-        df = pd.read_sql_query(query, conn)
-    
-    # Clean the data
-    df = clean_data(df)
-    
-    feature_columns = [
-        'pts', 'fgm', 'fga', 'fg_pct', 'fg3m', 'fg3a', 'fg3_pct',
-        'ftm', 'fta', 'ft_pct', 'oreb', 'dreb', 'ast', 'stl', 'blk',
-        'tov', 'pf', 'team_rest_days', 'efg', 'ts', 'treb', 'ast_to_ratio', 'possessions',
-        'ortg', 'drtg', 'efg_pct', 'tov_pct', 'orb_pct', 'ft_rate'
-    ]
-    
-    home_columns = [f'home_{col}' for col in feature_columns]
-    visitor_columns = [f'visitor_{col}' for col in feature_columns]
-    X = df[home_columns + visitor_columns]
-    y_win = df['home_team_win']
-    y_diff = df['home_pts'] - df['visitor_pts']  # Point differential
+# Shared read-only connections for every lookup below
+POOL = ReadPool(DB_NAME)
+
+FEATURE_COLUMNS = [
+    'pts', 'fgm', 'fga', 'fg_pct', 'fg3m', 'fg3a', 'fg3_pct',
+    'ftm', 'fta', 'ft_pct', 'oreb', 'dreb', 'ast', 'stl', 'blk',
+    'tov', 'pf', 'team_rest_days', 'efg', 'ts', 'treb', 'ast_to_ratio', 'possessions',
+    'ortg', 'drtg', 'efg_pct', 'tov_pct', 'orb_pct', 'ft_rate'
+]
+
+# Recent-form means for predict_slate, kept across slates until new games are ingested
+FORM_CACHE = FormCache(POOL, FEATURE_COLUMNS)
+
+# Part of the model fingerprint, so changing any of these forces a retrain
+HYPERPARAMETERS = {
+    'n_estimators': 100,
+    'random_state': 42,
+    'test_size': 0.2,
+}
+
+# Cores used for tree building (-1 = all), split between the two forests while they fit side by side
+N_JOBS = -1
+
+# A warm-started refresh adds this many trees, fit on the most recent games, to the saved forests
+WARM_START_TREES = 20
+WARM_START_WINDOW = 2000
+# Past this size a warm start rebuilds the forests from scratch instead
+MAX_TREES = 400
+
+def model_jobs(n_jobs):
+    # Each forest gets half of the cores since fit_models builds both at the same time
+    cores = os.cpu_count() if n_jobs == -1 else n_jobs
+    return max(1, cores // 2)
+
+@profiling.profiled
+def fit_models(win_model, diff_model, X_train, y_win_train, y_diff_train):
+    # Fit both forests at once; tree building releases the GIL, so the two fits overlap
+    def timed_fit(name, model, y):
+        started = time.perf_counter()
+        model.fit(X_train, y)
+        print(f"{name} fit in {time.perf_counter() - started:.2f}s ({model.n_estimators} trees, n_jobs={model.n_jobs})")
     
-    # Check for NaN values
-    if X.isna().any().any():
-        print("Warning: X contains NaN values")
-        print(X.isna().sum())
-    if y_win.isna().any():
-        print("Warning: y_win contains NaN values")
-    if y_diff.isna().any():
-        print("Warning: y_diff contains NaN values")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(timed_fit, "Win probability model", win_model, y_win_train),
+            executor.submit(timed_fit, "Point differential model", diff_model, y_diff_train),
+        ]
+        for future in futures:
+            future.result()
+
+@profiling.profiled
+def train_models(previous=None, n_jobs=N_JOBS, n_estimators=None):
+    # previous: (win_model, diff_model, scaler, feature_columns) to warm-start from, or None to train from scratch
+    n_estimators = n_estimators or HYPERPARAMETERS['n_estimators']
+    feature_columns = list(FEATURE_COLUMNS)
     
-    scaler = StandardScaler()
-    X_scaled = pd.DataFrame(scaler.fit_transform(X), columns=X.columns)
+    # Complete rows only, as a float32 matrix ordered by game_date, memory-mapped from the export next to the database
+    with POOL.connection() as conn:
+        X, y_win, y_diff = training_cache.load_training_data(conn, feature_columns, DB_NAME)
     
-    X_train, X_test, y_win_train, y_win_test, y_diff_train, y_diff_test = train_test_split(
-        X_scaled, y_win, y_diff, test_size=0.2, random_state=42)
+    if previous is not None:
+        # New trees only see the most recent games
+        X, y_win, y_diff = X[-WARM_START_WINDOW:], y_win[-WARM_START_WINDOW:], y_diff[-WARM_START_WINDOW:]
+    profiling.add_rows(len(X))
+    
+    # Wrapping the array keeps the feature names the scaler is fitted with, without copying it
+    X = pd.DataFrame(X, columns=training_cache.training_columns(feature_columns), copy=False)
     
-    # Train win probability model
-    win_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    win_model.fit(X_train, y_win_train)
+    jobs = model_jobs(n_jobs)
+    
+    if previous is not None:
+        # Keep the saved scaler so the existing trees still see features on the scale they were trained on
+        win_model, diff_model, scaler, _ = previous
+        X_scaled = pd.DataFrame(scaler.transform(X), columns=X.columns)
+        for model in (win_model, diff_model):
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + WARM_START_TREES, n_jobs=jobs)
+    else:
+        scaler = StandardScaler()
+        X_scaled = pd.DataFrame(scaler.fit_transform(X), columns=X.columns)
+        win_model = RandomForestClassifier(n_estimators=n_estimators, random_state=HYPERPARAMETERS['random_state'], n_jobs=jobs)
+        diff_model = RandomForestRegressor(n_estimators=n_estimators, random_state=HYPERPARAMETERS['random_state'], n_jobs=jobs)
+    
+    X_train, X_test, y_win_train, y_win_test, y_diff_train, y_diff_test = train_test_split(
+        X_scaled, y_win, y_diff, test_size=HYPERPARAMETERS['test_size'], random_state=HYPERPARAMETERS['random_state'])
     
-    # Train point differential model
-    diff_model = RandomForestRegressor(n_estimators=100, random_state=42)
-    diff_model.fit(X_train, y_diff_train)
+    # Train the win probability and point differential models
+    fit_models(win_model, diff_model, X_train, y_win_train, y_diff_train)
     
     print(f"Win probability model accuracy: {win_model.score(X_test, y_win_test):.2f}")
     print(f"Point differential model R² score: {diff_model.score(X_test, y_diff_test):.2f}")
     
     return win_model, diff_model, scaler, feature_columns
 
-def predict_game(win_model, diff_model, scaler, feature_columns, home_team_id, visitor_team_id, home_rest_days, visitor_rest_days):
-    home_games = get_home_games(home_team_id, 20)
-    visitor_games = get_visitor_games(visitor_team_id, 20)
-    matchup_games = get_matchup_stats(home_team_id, visitor_team_id, 4)
+@profiling.profiled
+def load_or_train_models(warm_start=False):
+    # Reuse the saved models unless the training data or hyperparameters changed
+    with POOL.connection() as conn:
+        fingerprint = model_store.training_fingerprint(conn, FEATURE_COLUMNS, HYPERPARAMETERS)
+    models = model_store.load_models(fingerprint)
+    if models is not None:
+        print("Loaded saved models")
+        return models
     
-    home_stats = home_games[[f'home_{col}' for col in feature_columns]].mean()
-    visitor_stats = visitor_games[[f'visitor_{col}' for col in feature_columns]].mean()
+    previous = model_store.load_latest_models() if warm_start else None
+    if previous is not None and previous[3] == FEATURE_COLUMNS and previous[0].n_estimators + WARM_START_TREES <= MAX_TREES:
+        print(f"Warm-starting saved models with {WARM_START_TREES} more trees...")
+        models = train_models(previous)
+    else:
+        print("Training models...")
+        models = train_models()
+    model_store.save_models(fingerprint, *models)
+    return models
+
+@profiling.profiled
+def predict_features(win_model, diff_model, scaler, features):
+    # features is a DataFrame with one row per game; returns arrays of win probabilities and point differentials
+    features_scaled = pd.DataFrame(scaler.transform(features), columns=features.columns)
+    win_probabilities = win_model.predict_proba(features_scaled)[:, 1]
+    point_differentials = diff_model.predict(features_scaled)
     
-    # Calculate matchup stats
-    if not matchup_games.empty:
-        matchup_home_stats = matchup_games[[f'home_{col}' for col in feature_columns]].mean()
-        matchup_visitor_stats = matchup_games[[f'visitor_{col}' for col in feature_columns]].mean()
-        
-        # Combine regular stats with matchup stats (you can adjust the weights)
-        home_stats = 0.8 * home_stats + 0.2 * matchup_home_stats
-        visitor_stats = 0.8 * visitor_stats + 0.2 * matchup_visitor_stats
+    return win_probabilities, point_differentials
+
+@profiling.profiled
+def get_team_ids(team_abbrs):
+    # Resolve a whole slate's abbreviations from the cached mapping; unknown teams are left out
+    team_ids = POOL.team_ids()
+    return {team_abbr: team_ids[team_abbr] for team_abbr in team_abbrs if team_abbr in team_ids}
+
+@profiling.profiled
+def predict_slate(win_model, diff_model, scaler, feature_columns, games, store=None, engine=None):
+    # games are dicts from parse_slate_line; each gets either a 'result' or an 'error'.
+    # engine: optional forest.CompiledModels for the same models, used for the complete rows
+    team_ids = get_team_ids([team for game in games for team in (game['home_team'], game['visitor_team'])])
+    
+    resolved = []
+    for game in games:
+        if game['home_team'] not in team_ids:
+            game['error'] = ValueError(f"Team '{game['home_team']}' not found in the database.")
+        elif game['visitor_team'] not in team_ids:
+            game['error'] = ValueError(f"Team '{game['visitor_team']}' not found in the database.")
+        else:
+            game['home_team_id'] = team_ids[game['home_team']]
+            game['visitor_team_id'] = team_ids[game['visitor_team']]
+            resolved.append(game)
+    profiling.add_rows(len(resolved))
+    if not resolved:
+        return games
     
-    # Update rest days
-    home_stats['home_team_rest_days'] = home_rest_days
-    visitor_stats['visitor_team_rest_days'] = visitor_rest_days
+    # Recent form comes from the given feature store, else the shared cache (or a store loaded for other columns)
+    if store is None and list(feature_columns) == FEATURE_COLUMNS:
+        store = FORM_CACHE
+    elif store is None:
+        store = TeamFormStore(feature_columns)
+        with profiling.span('load_team_form'), POOL.connection() as conn:
+            store.load(conn, [team_id for game in resolved for team_id in (game['home_team_id'], game['visitor_team_id'])])
     
-    features = pd.concat([home_stats, visitor_stats])
-    features = features.to_frame().T  # Convert to a single-row DataFrame
-    features.columns = [f'home_{col}' for col in feature_columns] + [f'visitor_{col}' for col in feature_columns]
+    matrix = store.feature_matrix(
+        (game['home_team_id'], game['visitor_team_id'], game['home_rest_days'], game['visitor_rest_days'])
+        for game in resolved
+    )
+    features = pd.DataFrame(matrix, columns=store.columns())
     
     # Check for NaN values
     if features.isna().any().any():
         print("Warning: features contain NaN values")
         print(features.isna().sum())
     
-    features_scaled = pd.DataFrame(scaler.transform(features), columns=features.columns)
-    win_probability = win_model.predict_proba(features_scaled)[0][1]
-    point_differential = diff_model.predict(features_scaled)[0]
+    # One vectorized pass for every complete row; rows with missing stats go alone so only they fail
+    complete = ~features.isna().any(axis=1)
+    if complete.any():
+        if engine is not None:
+            win_probabilities, point_differentials = engine.predict(matrix[complete.to_numpy()])
+        else:
+            win_probabilities, point_differentials = predict_features(win_model, diff_model, scaler, features[complete])
+        for game, win_probability, point_differential in zip(
+                [game for game, ok in zip(resolved, complete) if ok], win_probabilities, point_differentials):
+            game['result'] = (win_probability, point_differential)
+    for index in features.index[~complete]:
+        try:
+            win_probabilities, point_differentials = predict_features(win_model, diff_model, scaler, features.loc[[index]])
+            resolved[index]['result'] = (win_probabilities[0], point_differentials[0])
+        except Exception as e:
+            resolved[index]['error'] = e
     
-    return win_probability, point_differential
+    return games
 
-def get_team_id(team_abbr):
-    query = f"SELECT DISTINCT home_team_id FROM games WHERE home_team_abbr = '{team_abbr}'"
-    with sqlite3.connect(DB_NAME) as conn:
-        result = pd.read_sql_query(query, conn)
-    if result.empty:
-        raise ValueError(f"Team '{team_abbr}' not found in the database.")
-    return result.iloc[0]['home_team_id']
+def parse_slate_line(line):
+    home_team, visitor_team, home_rest_days, visitor_rest_days, moneyline, spread = line.strip().split(',')
+    return {
+        'line': line,
+        'home_team': home_team,
+        'visitor_team': visitor_team,
+        'home_rest_days': int(home_rest_days),
+        'visitor_rest_days': int(visitor_rest_days),
+        'moneyline': moneyline,
+        'spread': spread,
+    }
 
-def process_input_file(file_path, win_model, diff_model, scaler, feature_columns):
+def print_slate_game(game):
+    if 'error' not in game:
+        win_probability, point_differential = game['result']
+        print(f"\n{game['home_team']} vs {game['visitor_team']}: ML {game['moneyline']}, {game['spread']}")
+        print(f"probability: {win_probability:.2f}")
+        print(f"point diff: {point_differential:.1f}")
+    elif isinstance(game['error'], ValueError):
+        print(f"Error processing line: {game['line'].strip()}")
+        print(f"Error message: {str(game['error'])}")
+    else:
+        print(f"Unexpected error processing line: {game['line'].strip()}")
+        print(f"Error message: {str(game['error'])}")
+
+def parse_slate(lines):
+    # Parse the whole slate first, keeping malformed lines in place so output stays in input order
+    games = []
+    for line_number, line in enumerate(lines, 1):
+        try:
+            game = parse_slate_line(line)
+        except Exception as e:
+            game = {'line': line, 'error': e}
+        game['line_number'] = line_number
+        games.append(game)
+    return games
+
+@profiling.profiled
+def process_input_file(file_path, win_model, diff_model, scaler, feature_columns, engine=None):
     with open(file_path, 'r') as file:
-        for line in file:
-            try:
-                home_team, visitor_team, home_rest_days, visitor_rest_days, moneyline, spread = line.strip().split(',')
-                home_rest_days = int(home_rest_days)
-                visitor_rest_days = int(visitor_rest_days)
-                
-                home_team_id = get_team_id(home_team)
-                visitor_team_id = get_team_id(visitor_team)
-                
-                win_probability, point_differential = predict_game(win_model, diff_model, scaler, feature_columns, 
-                                                                   home_team_id, visitor_team_id, home_rest_days, visitor_rest_days)
-                
-                print(f"\n{home_team} vs {visitor_team}: ML {moneyline}, {spread}")
-                print(f"probability: {win_probability:.2f}")
-                print(f"point diff: {point_differential:.1f}")
-            except ValueError as e:
-                print(f"Error processing line: {line.strip()}")
-                print(f"Error message: {str(e)}")
-            except Exception as e:
-                print(f"Unexpected error processing line: {line.strip()}")
-                print(f"Error message: {str(e)}")
+        games = parse_slate(file.readlines())
+    
+    predict_slate(win_model, diff_model, scaler, feature_columns, [game for game in games if 'error' not in game], engine=engine)
+    
+    for game in games:
+        print_slate_game(game)
 
 # Main execution
 if __name__ == "__main__":
-    load_games()
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <input_file_path>")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-
-    try:
-        print("Training models...")
-        win_model, diff_model, scaler, feature_columns = train_models()
-        
-        print("\nProcessing input file...")
-        process_input_file(input_file, win_model, diff_model, scaler, feature_columns)
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        print("Please check your database and input file to ensure they contain the necessary data.")
-        raise  # Re-raise the exception to see the full traceback
\ No newline at end of file
+    # Same as: python cli.py predict <input_file_path>
+    import cli
+    cli.main(['predict'] + sys.argv[1:])
@@ -0,0 +1,6 @@
+import importlib
+import sys
+
+# pre-dict.py is not a valid module name for a plain import, so every other script imports it as `predict`
+# through this module, which stands in for pre-dict itself
+sys.modules[__name__] = importlib.import_module('pre-dict')
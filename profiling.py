@@ -0,0 +1,195 @@
+import cProfile
+import functools
+import json
+import pstats
+import re
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Everything here is a no-op until enable() is called, so the instrumented code pays nothing in normal runs.
+# Span names nest per thread ('load_games/combine_games'); repeated spans with the same path are summed.
+
+TOP_QUERIES = 20
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+class Profile:
+    def __init__(self, memory=False, cpu=False):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = {}
+        self.queries = {}
+        self.memory = memory
+        self.cpu = cProfile.Profile() if cpu else None
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def current(self):
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def totals(self, path):
+        totals = self.spans.get(path)
+        if totals is None:
+            totals = self.spans[path] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'queries': 0, 'query_seconds': 0.0}
+        return totals
+
+    def record_query(self, sql, seconds):
+        sql = re.sub(r'\s+', ' ', sql).strip()
+        path = self.current()
+        with self.lock:
+            query = self.queries.get(sql)
+            if query is None:
+                query = self.queries[sql] = {'count': 0, 'seconds': 0.0}
+            query['count'] += 1
+            query['seconds'] += seconds
+            if path is not None:
+                totals = self.totals(path)
+                totals['queries'] += 1
+                totals['query_seconds'] += seconds
+
+PROFILE = None
+
+def enable(memory=False, cpu=False):
+    global PROFILE
+    PROFILE = Profile(memory, cpu)
+    if memory:
+        tracemalloc.start()
+    if PROFILE.cpu is not None:
+        PROFILE.cpu.enable()
+
+def enabled():
+    return PROFILE is not None
+
+@contextmanager
+def span(name):
+    profile = PROFILE
+    if profile is None:
+        yield
+        return
+
+    stack = profile.stack()
+    path = f"{stack[-1]}/{name}" if stack else name
+    stack.append(path)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        stack.pop()
+        with profile.lock:
+            totals = profile.totals(path)
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+
+def profiled(function):
+    # Decorator: a span named after the function around every call
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if PROFILE is None:
+            return function(*args, **kwargs)
+        with span(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def add_rows(rows):
+    # Counts rows against the innermost open span of this thread
+    profile = PROFILE
+    if profile is None:
+        return
+    path = profile.current()
+    if path is not None:
+        with profile.lock:
+            profile.totals(path)['rows'] += rows
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Times execute/executemany; rows fetched afterwards are not included
+    def execute(self, sql, parameters=()):
+        if PROFILE is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            PROFILE.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if PROFILE is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            PROFILE.record_query(sql, time.perf_counter() - started)
+
+class ProfiledConnection(sqlite3.Connection):
+    # Every statement, including pandas' reads and the Connection.execute shortcuts, ends up in ProfiledCursor
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(database, **kwargs):
+    # sqlite3.connect, with per-statement timing while profiling is enabled
+    if PROFILE is None:
+        return sqlite3.connect(database, **kwargs)
+    return sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+
+def report():
+    profile = PROFILE
+    if profile is None:
+        return None
+
+    result = {
+        'started_at': profile.started_at,
+        'command': sys.argv,
+        'total_seconds': time.perf_counter() - profile.started,
+        'spans': [{'name': path, **totals} for path, totals in profile.spans.items()],
+        'queries': [
+            {'sql': sql[:500], **query}
+            for sql, query in sorted(profile.queries.items(), key=lambda item: -item[1]['seconds'])[:TOP_QUERIES]
+        ],
+        'query_count': sum(query['count'] for query in profile.queries.values()),
+        'query_seconds': sum(query['seconds'] for query in profile.queries.values()),
+    }
+
+    if profile.memory and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+        result['memory'] = {
+            'current_mb': current / 2 ** 20,
+            'peak_mb': peak / 2 ** 20,
+            'top_allocations': [{'location': str(stat.traceback), 'mb': stat.size / 2 ** 20, 'count': stat.count}
+                                for stat in statistics],
+        }
+
+    if profile.cpu is not None:
+        profile.cpu.disable()
+        stats = pstats.Stats(profile.cpu)
+        functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+        result['cpu'] = [
+            {'function': f"{filename}:{line}({name})", 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in functions
+        ]
+        profile.cpu.enable()
+
+    return result
+
+def write_report(path):
+    with open(path, 'w') as report_file:
+        json.dump(report(), report_file, indent=2)
+    print(f"profile written to {path}")
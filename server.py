@@ -0,0 +1,155 @@
+import argparse
+import copy
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from feature_store import TeamFormStore
+from forest import CompiledModels
+from get_games import load_games
+import predict
+
+class PredictionState:
+    # Everything a request needs; replaced as a whole so in-flight requests keep a consistent view
+    def __init__(self, models, store, engine=None):
+        self.models = models
+        self.store = store
+        self.engine = engine
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+def load_state(warm_start=False, engine='sklearn', store=None):
+    # store: the current state's feature store, brought up to date on a copy so requests keep using the old one
+    models = predict.load_or_train_models(warm_start)
+    with predict.POOL.connection() as conn:
+        if store is None:
+            store = TeamFormStore(predict.FEATURE_COLUMNS)
+            store.load(conn)
+        else:
+            store = copy.deepcopy(store)
+            added = store.update(conn)
+            print(f"feature store updated ({added} games pushed)")
+    compiled = CompiledModels(*models) if engine == 'compact' else None
+    return PredictionState(models, store, compiled)
+
+def game_response(game):
+    if 'error' in game:
+        return {'line': game['line'].strip(), 'error': str(game['error'])}
+
+    win_probability, point_differential = game['result']
+    return {
+        'line': game['line'].strip(),
+        'home_team': game['home_team'],
+        'visitor_team': game['visitor_team'],
+        'moneyline': game['moneyline'],
+        'spread': game['spread'],
+        'probability': float(win_probability),
+        'point_diff': float(point_differential),
+    }
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state, engine='sklearn'):
+        super().__init__(address, PredictionHandler)
+        self.state = state
+        self.engine = engine
+        self.reload_lock = threading.Lock()
+
+    def reload(self, ingest=False):
+        # Retrain in the background and swap the new state in; returns False if a reload is already running
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                if ingest:
+                    load_games()
+                # After an ingest only a few games are new, so extend the saved forests instead of rebuilding them
+                self.state = load_state(warm_start=ingest, engine=self.engine, store=self.state.store)
+                print(f"models reloaded at {self.state.loaded_at}")
+            except Exception as e:
+                print(f"Reload failed: {e}")
+            finally:
+                self.reload_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            self.send_json(404, {'error': 'not found'})
+            return
+        self.send_json(200, {
+            'status': 'ok',
+            'loaded_at': self.server.state.loaded_at,
+            'reloading': self.server.reload_lock.locked(),
+        })
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/predict':
+            self.handle_predict()
+        elif url.path == '/reload':
+            ingest = parse_qs(url.query).get('ingest', ['0'])[0] == '1'
+            started = self.server.reload(ingest)
+            self.send_json(202 if started else 409, {'reloading': True, 'started': started})
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def handle_predict(self):
+        # Body is a slate in the input file format, one game per line
+        length = int(self.headers.get('Content-Length', 0))
+        lines = [line for line in self.rfile.read(length).decode().splitlines() if line.strip()]
+
+        # Take one reference to the state so a concurrent reload cannot change models mid-request
+        state = self.server.state
+        games = predict.parse_slate(lines)
+        try:
+            predict.predict_slate(*state.models, [game for game in games if 'error' not in game], store=state.store,
+                                  engine=state.engine)
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        self.send_json(200, {'loaded_at': state.loaded_at, 'games': [game_response(game) for game in games]})
+
+def refresh_periodically(server, minutes):
+    while True:
+        time.sleep(minutes * 60)
+        server.reload(ingest=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve slate predictions from warm models over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--refresh-minutes', type=float, default=0,
+                        help="ingest new games and retrain in the background every N minutes (0 disables)")
+    parser.add_argument('--engine', choices=['sklearn', 'compact'], default='sklearn',
+                        help="score with scikit-learn or with the forests compiled into NumPy node tables")
+    args = parser.parse_args()
+
+    server = PredictionServer((args.host, args.port), load_state(engine=args.engine), args.engine)
+    if args.refresh_minutes > 0:
+        threading.Thread(target=refresh_periodically, args=(server, args.refresh_minutes), daemon=True).start()
+
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import model_store
+import predict
+from feature_store import TeamFormStore, HOME_WINDOW, MATCHUP_WINDOW, MATCHUP_WEIGHT
+
+# Rows per task handed to a worker
+CHUNK_ROWS = 2000
+
+RESULT_FIELDS = [
+    'line', 'home_team', 'visitor_team', 'swapped', 'home_rest_days', 'visitor_rest_days',
+    'form_window', 'matchup_window', 'matchup_weight', 'moneyline', 'spread', 'probability', 'point_diff',
+]
+
+def parse_list(text, convert):
+    return [convert(value) for value in text.split(',') if value.strip()]
+
+def build_scenarios(games, rest_days=None, swap=False, form_windows=(HOME_WINDOW,),
+                    matchup_windows=(MATCHUP_WINDOW,), matchup_weights=(MATCHUP_WEIGHT,)):
+    # Every combination of the grid for every resolved slate game; rest_days=None keeps each game's own rest days
+    scenarios = []
+    for game in games:
+        orientations = [(game['home_team'], game['visitor_team'], game['home_team_id'], game['visitor_team_id'], False)]
+        if swap:
+            orientations.append((game['visitor_team'], game['home_team'], game['visitor_team_id'], game['home_team_id'], True))
+        if rest_days is None:
+            rests = [(game['home_rest_days'], game['visitor_rest_days'])]
+        else:
+            rests = list(itertools.product(rest_days, rest_days))
+
+        for (home_team, visitor_team, home_team_id, visitor_team_id, swapped), (home_rest, visitor_rest), \
+                form_window, matchup_window, matchup_weight in itertools.product(
+                    orientations, rests, form_windows, matchup_windows, matchup_weights):
+            if swapped and rest_days is None:
+                home_rest, visitor_rest = visitor_rest, home_rest
+            scenarios.append({
+                'line': game['line_number'],
+                'home_team': home_team,
+                'visitor_team': visitor_team,
+                'home_team_id': home_team_id,
+                'visitor_team_id': visitor_team_id,
+                'swapped': int(swapped),
+                'home_rest_days': home_rest,
+                'visitor_rest_days': visitor_rest,
+                'form_window': form_window,
+                'matchup_window': matchup_window,
+                'matchup_weight': matchup_weight,
+                'moneyline': game['moneyline'],
+                'spread': game['spread'],
+            })
+    return scenarios
+
+def scenario_matrix(store, scenarios):
+    # Window means are cached per team and window inside the store, so each is computed once for the whole grid
+    matrix = np.empty((len(scenarios), len(store.columns())))
+    for i, scenario in enumerate(scenarios):
+        matrix[i] = store.scenario_features(
+            scenario['home_team_id'], scenario['visitor_team_id'],
+            scenario['home_rest_days'], scenario['visitor_rest_days'],
+            scenario['form_window'], scenario['form_window'],
+            scenario['matchup_window'], scenario['matchup_weight'])
+    return matrix
+
+# Per-process models and the artifact they came from
+WORKER_MODELS = None
+WORKER_PATH = None
+
+def init_worker(path):
+    # Forked workers inherit the models the parent loaded and share their pages copy-on-write (nothing writes
+    # to the tree arrays); workers started any other way load their own copy
+    global WORKER_MODELS, WORKER_PATH
+    if WORKER_PATH != path:
+        artifact = joblib.load(path)
+        WORKER_MODELS = artifact['win_model'], artifact['diff_model'], artifact['scaler'], artifact['feature_columns']
+        WORKER_PATH = path
+
+def predict_chunk(matrix):
+    win_model, diff_model, scaler, feature_columns = WORKER_MODELS
+    columns = [f'home_{col}' for col in feature_columns] + [f'visitor_{col}' for col in feature_columns]
+    return predict.predict_features(win_model, diff_model, scaler, pd.DataFrame(matrix, columns=columns))
+
+def predict_matrix(path, matrix, workers):
+    # NaN rows (a team without games in a window) get NaN results instead of failing the chunk
+    probabilities = np.full(len(matrix), np.nan)
+    point_diffs = np.full(len(matrix), np.nan)
+    complete = np.flatnonzero(~np.isnan(matrix).any(axis=1))
+    chunks = [complete[start:start + CHUNK_ROWS] for start in range(0, len(complete), CHUNK_ROWS)]
+
+    init_worker(path)
+    if workers <= 1:
+        results = [predict_chunk(matrix[chunk]) for chunk in chunks]
+    else:
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(path,)) as executor:
+            results = list(executor.map(predict_chunk, [matrix[chunk] for chunk in chunks]))
+
+    for chunk, (chunk_probabilities, chunk_point_diffs) in zip(chunks, results):
+        probabilities[chunk] = chunk_probabilities
+        point_diffs[chunk] = chunk_point_diffs
+    return probabilities, point_diffs
+
+def models_path():
+    # Artifact for the current data, trained first if there is none yet
+    predict.load_or_train_models()
+    with predict.POOL.connection() as conn:
+        fingerprint = model_store.training_fingerprint(conn, predict.FEATURE_COLUMNS, predict.HYPERPARAMETERS)
+    return model_store.artifact_path(fingerprint)
+
+def run_sweep(input_file, workers, **grid):
+    with open(input_file) as slate_file:
+        games = predict.parse_slate(slate_file.readlines())
+    for game in games:
+        if 'error' in game:
+            print(f"Skipping line: {game['line'].strip()} ({game['error']})")
+    games = [game for game in games if 'error' not in game]
+
+    team_ids = predict.get_team_ids([team for game in games for team in (game['home_team'], game['visitor_team'])])
+    for game in games:
+        for side in ('home', 'visitor'):
+            if game[f'{side}_team'] not in team_ids:
+                print(f"Skipping line: {game['line'].strip()} (Team '{game[f'{side}_team']}' not found in the database.)")
+    games = [game for game in games if game['home_team'] in team_ids and game['visitor_team'] in team_ids]
+    for game in games:
+        game['home_team_id'] = team_ids[game['home_team']]
+        game['visitor_team_id'] = team_ids[game['visitor_team']]
+
+    scenarios = build_scenarios(games, **grid)
+    if not scenarios:
+        return scenarios
+
+    # One store holding the largest windows of the grid; smaller windows are read from the same rows
+    form_window = max(scenario['form_window'] for scenario in scenarios)
+    store = TeamFormStore(predict.FEATURE_COLUMNS, home_window=form_window, visitor_window=form_window,
+                          matchup_window=max(scenario['matchup_window'] for scenario in scenarios))
+    with predict.POOL.connection() as conn:
+        store.load(conn, list(team_ids.values()))
+
+    started = time.perf_counter()
+    matrix = scenario_matrix(store, scenarios)
+    print(f"{len(scenarios)} scenarios built in {time.perf_counter() - started:.2f}s")
+
+    path = models_path()
+    started = time.perf_counter()
+    probabilities, point_diffs = predict_matrix(path, matrix, workers)
+    print(f"{len(scenarios)} scenarios predicted in {time.perf_counter() - started:.2f}s with {workers} worker(s)")
+
+    for scenario, probability, point_diff in zip(scenarios, probabilities, point_diffs):
+        scenario['probability'] = probability
+        scenario['point_diff'] = point_diff
+    return scenarios
+
+def write_results(path, scenarios):
+    with open(path, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(scenarios)
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict a slate under a grid of what-if scenarios.")
+    parser.add_argument('input_file', help="slate in the usual format: home,away,home_rest,away_rest,moneyline,spread")
+    parser.add_argument('--rest-days', help="comma-separated rest days to try for both teams, e.g. 0,1,2,3 (default: the slate's)")
+    parser.add_argument('--swap', action='store_true', help="also predict every game with home and away swapped")
+    parser.add_argument('--form-windows', default=str(HOME_WINDOW), help="comma-separated home/visitor form windows")
+    parser.add_argument('--matchup-windows', default=str(MATCHUP_WINDOW), help="comma-separated head-to-head windows")
+    parser.add_argument('--matchup-weights', default=str(MATCHUP_WEIGHT), help="comma-separated head-to-head blend weights")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="prediction processes (1 predicts in this process)")
+    parser.add_argument('--output', default='sweep.csv', help="where to write the result table")
+    args = parser.parse_args()
+
+    scenarios = run_sweep(
+        args.input_file, args.workers,
+        rest_days=parse_list(args.rest_days, int) if args.rest_days else None,
+        swap=args.swap,
+        form_windows=parse_list(args.form_windows, int),
+        matchup_windows=parse_list(args.matchup_windows, int),
+        matchup_weights=parse_list(args.matchup_weights, float),
+    )
+    write_results(args.output, scenarios)
+    print(f"{len(scenarios)} scenarios written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+
+import profiling
+from get_games import last_change
+
+# Bump when the layout of the exported arrays changes
+CACHE_VERSION = 1
+CHUNK_ROWS = 10000
+
+def cache_paths(db_name):
+    # nba.sqlite -> nba.training.X.npy, nba.training.y_win.npy, nba.training.y_diff.npy, nba.training.json
+    base = os.path.splitext(db_name)[0] + '.training'
+    return {
+        'X': base + '.X.npy',
+        'y_win': base + '.y_win.npy',
+        'y_diff': base + '.y_diff.npy',
+        'meta': base + '.json',
+    }
+
+def training_columns(feature_columns):
+    return [f'home_{col}' for col in feature_columns] + [f'visitor_{col}' for col in feature_columns]
+
+def describe_games(conn, columns):
+    # Identifies the table contents the arrays were exported from. The ingest run catches rewrites that keep the
+    # row count and newest date, like one-sided games completed by a catch-up ingest.
+    row_count, max_game_date = conn.execute('SELECT COUNT(*), MAX(game_date) FROM games').fetchone()
+    return {
+        'version': CACHE_VERSION,
+        'row_count': row_count,
+        'max_game_date': max_game_date,
+        'last_change': last_change(conn),
+        'columns': columns,
+    }
+
+@profiling.profiled
+def export_training_data(conn, feature_columns, db_name):
+    # Stream the complete rows, oldest first, straight into float32 .npy files without a DataFrame in between
+    columns = training_columns(feature_columns)
+    paths = cache_paths(db_name)
+    required = columns + ['home_team_win', 'home_pts', 'visitor_pts']
+    where = ' AND '.join(f'{col} IS NOT NULL' for col in required)
+
+    # One read transaction so the row count and the rows come from the same snapshot
+    conn.execute('BEGIN')
+    try:
+        description = describe_games(conn, columns)
+        row_count = conn.execute(f'SELECT COUNT(*) FROM games WHERE {where}').fetchone()[0]
+
+        tmp = {name: path + '.tmp.npy' for name, path in paths.items() if name != 'meta'}
+        X = np.lib.format.open_memmap(tmp['X'], mode='w+', dtype=np.float32, shape=(row_count, len(columns)))
+        y_win = np.lib.format.open_memmap(tmp['y_win'], mode='w+', dtype=np.int8, shape=(row_count,))
+        y_diff = np.lib.format.open_memmap(tmp['y_diff'], mode='w+', dtype=np.float32, shape=(row_count,))
+
+        cursor = conn.execute(f'''
+        SELECT {', '.join(columns)}, home_team_win, home_pts - visitor_pts
+        FROM games
+        WHERE {where}
+        ORDER BY game_date, game_id
+        ''')
+        start = 0
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            block = np.array(rows, dtype=np.float64)
+            end = start + len(block)
+            X[start:end] = block[:, :len(columns)]
+            y_win[start:end] = block[:, -2]
+            y_diff[start:end] = block[:, -1]
+            start = end
+    finally:
+        conn.execute('ROLLBACK')
+
+    for array in (X, y_win, y_diff):
+        array.flush()
+    del X, y_win, y_diff
+    for name, tmp_path in tmp.items():
+        os.replace(tmp_path, paths[name])
+
+    # Written last: the arrays are only trusted once their description is in place
+    with open(paths['meta'], 'w') as meta_file:
+        json.dump(description, meta_file)
+    profiling.add_rows(row_count)
+    print(f"training data exported ({row_count} rows)")
+
+@profiling.profiled
+def load_training_data(conn, feature_columns, db_name):
+    # Returns memory-mapped (X, y_win, y_diff), re-exporting first if the games table changed since the last export
+    columns = training_columns(feature_columns)
+    paths = cache_paths(db_name)
+
+    cached = None
+    if os.path.exists(paths['meta']):
+        with open(paths['meta']) as meta_file:
+            cached = json.load(meta_file)
+    if cached != describe_games(conn, columns):
+        export_training_data(conn, feature_columns, db_name)
+
+    return (
+        np.load(paths['X'], mmap_mode='r'),
+        np.load(paths['y_win'], mmap_mode='r'),
+        np.load(paths['y_diff'], mmap_mode='r'),
+    )